@@ -0,0 +1,218 @@
+"""
+Admission control.
+
+gunicorn runs each worker with more threads than it lets execute at once
+(ADMISSION_CAPACITY). The spare threads are a waiting room: a request that
+can't start right away waits there, and when a slot frees up the highest
+priority class waiting gets it first:
+
+    critical   login, sign-up, sessions, bookings, waitlist, recording payments
+    default    everything else (catalog reads, profiles, admin edits)
+    bulk       reports, forecasts, audit log, transaction exports
+
+Each class is also capped (ADMISSION_CLASS_LIMITS), and so are single
+Resources (ADMISSION_ROUTE_LIMITS), so a burst of reports can't use up a
+worker. A request whose predicted wait (queue ahead of it times the class's
+recent run time) is over ADMISSION_LATENCY_TARGET_MS, or that has waited
+that long, gets a 503 with Retry-After right away.
+
+The limits are per worker. Queue depth, in-flight and shed counts are on
+/metrics (summed over workers) and at /admin/load (the answering worker).
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, jsonify, request
+from flask_restful import Resource
+from prometheus_client import Counter as MetricCounter, Gauge, Histogram
+
+from metrics import resource_name
+from utils import role_required
+
+PRIORITIES = ("critical", "default", "bulk")  # Highest first
+
+# Resource, or "Resource.METHOD", -> priority class; anything else is "default"
+ROUTE_CLASSES = {
+    "Login": "critical",
+    "Signup": "critical",
+    "RefreshToken": "critical",
+    "CheckSession": "critical",
+    "Logout": "critical",
+    "BookingResource": "critical",
+    "BookingBatchResource": "critical",
+    "BookingCancelResource": "critical",
+    "WaitlistResource": "critical",
+    "WaitlistEntryResource": "critical",
+    "TransactionResource.POST": "critical",
+    "TransactionResource.GET": "bulk",
+    "ReportsResource": "bulk",
+    "ForecastResource": "bulk",
+    "AuditLogResource": "bulk",
+}
+
+EXEMPT_ENDPOINTS = ("metrics", "api.loadresource")
+
+IN_FLIGHT = Gauge("admission_in_flight", "Requests running", ["priority"], multiprocess_mode="livesum")
+WAITING = Gauge("admission_waiting", "Requests queued for a slot", ["priority"], multiprocess_mode="livesum")
+SHED = MetricCounter("admission_shed_total", "Requests answered 503 instead of queueing", ["priority"])
+WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time queued before running", ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+EWMA_WEIGHT = 0.2  # Weight of the newest run time in each class's average
+
+
+class Gate:
+    """One worker's slots, shared by its threads."""
+
+    def __init__(self, capacity, class_limits, route_limits, target):
+        self.capacity = capacity
+        self.class_limits = {priority: class_limits.get(priority, capacity) for priority in PRIORITIES}
+        self.route_limits = route_limits
+        self.target = target
+        self.in_flight = Counter()
+        self.route_in_flight = Counter()
+        self.waiting = Counter()
+        self.waiting_routes = Counter()  # (priority, route) -> queued requests
+        self.shed = Counter()
+        self.run_time = {priority: 0.1 for priority in PRIORITIES}  # Seconds, moving average
+        self._condition = threading.Condition()
+
+    def _under_limits(self, priority, route):
+        if self.in_flight[priority] >= self.class_limits[priority]:
+            return False
+        return route not in self.route_limits or self.route_in_flight[route] < self.route_limits[route]
+
+    def _can_run(self, priority, route):
+        if sum(self.in_flight.values()) >= self.capacity or not self._under_limits(priority, route):
+            return False
+        # Yield to a higher class only if one of its waiters could take the slot; one held back
+        # by its own class or route cap would leave it idle
+        higher = PRIORITIES[:PRIORITIES.index(priority)]
+        return not any(
+            count and waiting_priority in higher and self._under_limits(waiting_priority, waiting_route)
+            for (waiting_priority, waiting_route), count in self.waiting_routes.items()
+        )
+
+    def expected_wait(self, priority):
+        """Seconds a new request of this class would queue: everything ahead of it, drained by its slots."""
+        ahead = sum(self.waiting[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        slots = min(self.capacity, self.class_limits[priority])
+        return (ahead + 1) * self.run_time[priority] / max(slots, 1)
+
+    def _start(self, priority, route):
+        self.in_flight[priority] += 1
+        self.route_in_flight[route] += 1
+        IN_FLIGHT.labels(priority).inc()
+
+    def admit(self, priority, route):
+        """Take a slot, queueing up to the latency target. Returns None, or the seconds to retry after."""
+        started = time.monotonic()
+        with self._condition:
+            if self._can_run(priority, route):
+                self._start(priority, route)
+                return None
+            wait = self.expected_wait(priority)
+            if wait > self.target:
+                self.shed[priority] += 1
+                return wait
+
+            deadline = started + self.target
+            self.waiting[priority] += 1
+            self.waiting_routes[priority, route] += 1
+            WAITING.labels(priority).inc()
+            try:
+                while not self._can_run(priority, route):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed[priority] += 1
+                        return self.expected_wait(priority)
+                    self._condition.wait(remaining)
+                self._start(priority, route)
+            finally:
+                self.waiting[priority] -= 1
+                self.waiting_routes[priority, route] -= 1
+                WAITING.labels(priority).dec()
+                # Lower classes may have been held back only by this request waiting
+                self._condition.notify_all()
+        WAIT_SECONDS.labels(priority).observe(time.monotonic() - started)
+        return None
+
+    def release(self, priority, route, run_time):
+        with self._condition:
+            self.in_flight[priority] -= 1
+            self.route_in_flight[route] -= 1
+            self.run_time[priority] += EWMA_WEIGHT * (run_time - self.run_time[priority])
+            IN_FLIGHT.labels(priority).dec()
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                priority: {
+                    "limit": self.class_limits[priority],
+                    "in_flight": self.in_flight[priority],
+                    "waiting": self.waiting[priority],
+                    "shed": self.shed[priority],
+                    "avg_ms": round(self.run_time[priority] * 1000, 1),
+                }
+                for priority in PRIORITIES
+            }
+
+
+def priority_of(route, method):
+    return ROUTE_CLASSES.get(f"{route}.{method}") or ROUTE_CLASSES.get(route, "default")
+
+
+def _admit():
+    if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS or request.method == "OPTIONS":
+        return None
+    gate = current_app.extensions["admission"]
+    route = resource_name()
+    priority = priority_of(route, request.method)
+    retry_after = gate.admit(priority, route)
+    if retry_after is not None:
+        SHED.labels(priority).inc()
+        response = jsonify({"error": "The server is busy, please try again shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+    g.admission = (priority, route, time.perf_counter())
+    return None
+
+
+def _release(exc):
+    admitted = g.pop("admission", None)
+    if admitted is not None:
+        priority, route, started = admitted
+        current_app.extensions["admission"].release(priority, route, time.perf_counter() - started)
+
+
+class LoadResource(Resource):
+    @role_required("admin")
+    def get(self):
+        """This worker's slots: running and queued requests per priority class."""
+        gate = current_app.extensions.get("admission")
+        if gate is None:
+            return {"error": "Admission control is disabled (ADMISSION_ENABLED)"}, 404
+        return {
+            "worker": os.getpid(),
+            "capacity": gate.capacity,
+            "latency_target_ms": round(gate.target * 1000),
+            "priorities": gate.snapshot(),
+        }, 200
+
+
+def init_app(app):
+    if not app.config["ADMISSION_ENABLED"]:
+        return
+    app.extensions["admission"] = Gate(
+        app.config["ADMISSION_CAPACITY"], app.config["ADMISSION_CLASS_LIMITS"],
+        app.config["ADMISSION_ROUTE_LIMITS"], app.config["ADMISSION_LATENCY_TARGET_MS"] / 1000,
+    )
+    app.before_request(_admit)
+    app.teardown_request(_release)
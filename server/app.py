@@ -2,19 +2,46 @@
 
 from datetime import datetime, timedelta
 
-from flask import request, session, jsonify, make_response
-from flask_restful import Resource
-from flask_jwt_extended import create_access_token, jwt_required, set_access_cookies, unset_jwt_cookies, get_jwt_identity
-from config import app, db, api, avatar
-from models import User, Staff, Service, StaffService, Review, Transaction, Booking
-
+from flask import Blueprint, request, session, jsonify, make_response
+from flask_restful import Api, Resource
+from flask_jwt_extended import jwt_required, set_access_cookies, set_refresh_cookies, unset_jwt_cookies, get_jwt_identity, get_jwt, verify_jwt_in_request
+from config import avatar
+from extensions import db
+from models import User, Staff, Service, StaffService, Review, Transaction, TransactionArchive, Booking, UserStats, BOOKING_ACTIVE_STATUSES
+
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from utils import role_required
 from sqlalchemy.exc import IntegrityError
 from reports import ReportsResource
+from forecasting import ForecastResource
+from archive import transaction_rows
+from session_cache import user_claims, get_user_profile, revoke_token, CLAIM_FIELDS
+from tokens import issue_tokens, rotate_refresh_token, revoke_refresh_family
+from search import SearchResource
+from history import UserHistoryResource, UserHistoryListResource
+from staffing import ServiceStaffResource, StaffServicesResource, StaffServiceLinkResource, is_qualified
+from idempotency import idempotent
+from http_cache import conditional
+from audit import AuditLogResource
+from pricing import ServicePriceResource, price_at
+from recommendations import ServiceRecommendationsResource
+from waitlist import WaitlistResource, WaitlistEntryResource, fill_slot
+from branches import BranchListResource
+from profiling import ProfileListResource, ProfileResource
+from admission import LoadResource
+from media import MediaResource, MediaUploadResource
+from reminders import ReminderStatusResource
+from serializers import SERVICE, REVIEW, STAFF_REVIEW, BOOKING_LIST, TRANSACTION_LIST, staff_payload, output_json
 # import traceback
 # from werkzeug.utils import secure_filename
 # import os
 
+# Registered on the app by config.create_app()
+api_bp = Blueprint("api", __name__)
+api = Api(api_bp)
+api.representation("application/json")(output_json)
+
 class Home(Resource):
     def get(self):
         return {"message": "Backend is running successfully!"}
@@ -33,7 +60,7 @@ class Signup(Resource):
             data = request.json
 
             # Validate input fields
-            required_fields = ["name", "username", "email", "password", "image"]
+            required_fields = ["name", "username", "email", "password"]
             missing_fields = [field for field in required_fields if field not in data]
             if missing_fields:
                 return {"message": f"Missing fields: {', '.join(missing_fields)}"}, 400
@@ -59,17 +86,15 @@ class Signup(Resource):
             db.session.add(user)
             db.session.commit()
 
-            # Create a JWT token
-            access_token = create_access_token(
-                identity=str(user.id),  # Pass user ID as a string
-                expires_delta=timedelta(days=30)
-            )
+            # Create JWT tokens (user ID is passed as a string)
+            access_token, refresh_token = issue_tokens(str(user.id), user_claims(user))
 
             # Create a response object
             response = make_response({"message": "User registered successfully"}, 201)
 
-            # Set the token in an HTTP-only cookie
+            # Set the tokens in HTTP-only cookies
             set_access_cookies(response, access_token)
+            set_refresh_cookies(response, refresh_token)
 
             return response
 
@@ -89,15 +114,15 @@ class CheckSession(Resource):
     @jwt_required(locations=["cookies"])  # Ensure JWT is read from cookies
     def get(self):
         current_user_id = get_jwt_identity()  # Extract user ID from JWT
-        user = db.session.get(User, current_user_id)  
+        claims = get_jwt()
 
-        if user:
-            return {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "role": user.role  # Return role if needed
-            }, 200
+        # Tokens carry the profile fields; older tokens fall back to the cached profile
+        if all(field in claims for field in CLAIM_FIELDS):
+            return {"id": int(current_user_id), **{field: claims[field] for field in CLAIM_FIELDS}}, 200
+
+        profile = get_user_profile(current_user_id)
+        if profile:
+            return profile, 200
 
         return {"message": "User not found"}, 404
 
@@ -109,11 +134,8 @@ class Login(Resource):
         user = User.query.filter_by(username=data['username']).first()
 
         if user and user.check_password(data['password']):
-            # Create JWT Token
-            access_token = create_access_token(
-                identity=str(user.id),
-                additional_claims={"role": user.role}
-            )
+            # Create JWT Tokens
+            access_token, refresh_token = issue_tokens(str(user.id), user_claims(user))
 
             # Create JSON response with token & user info
             response = jsonify({
@@ -125,17 +147,36 @@ class Login(Resource):
                 "role": user.role
             })
 
-            # Set JWT token in cookies
+            # Set JWT tokens in cookies
             set_access_cookies(response, access_token)
+            set_refresh_cookies(response, refresh_token)
             return response
 
         return {"message": "Invalid credentials"}, 401
+
+
+class RefreshToken(Resource):
+    @jwt_required(refresh=True)
+    def post(self):
+        """Trade a refresh token for a new access/refresh pair without re-checking the password."""
+        tokens = rotate_refresh_token(get_jwt())
+        if tokens is None:
+            response = jsonify({"message": "Refresh token is no longer valid"})
+            response.status_code = 401
+            unset_jwt_cookies(response)
+            return response
+
+        access_token, refresh_token = tokens
+        response = jsonify({"message": "Token refreshed", "access_token": access_token})
+        set_access_cookies(response, access_token)
+        set_refresh_cookies(response, refresh_token)
+        return response
     
     
 class ServiceResource(Resource):
+    @conditional(Service)
     def get(self):
-        services = Service.query.all()
-        return [service.to_dict() for service in services], 200
+        return SERVICE.all(SERVICE.select().order_by(Service.id)), 200
 
     def post(self):
         data = request.get_json()
@@ -153,7 +194,7 @@ class ServiceResource(Resource):
             db.session.add(new_service)
             db.session.commit()
 
-            return {"message": "Service added successfully!", "service": new_service.to_dict()}, 201
+            return {"message": "Service added successfully!", "service": SERVICE.dump_obj(new_service)}, 201
         except Exception as e:
             return {"message": str(e)}, 500
         
@@ -188,17 +229,17 @@ class ServiceResource(Resource):
     
 
 class StaffResource(Resource):
+    @conditional(Staff, StaffService, Review, Transaction, Booking)
     def get(self, id=None):  # Accepts optional `id`
         if id is None:
             # Fetch all staff members
-            staff_members = Staff.query.all()
-            return [staff.to_dict() for staff in staff_members], 200
+            return staff_payload(), 200
         else:
             # Fetch a specific staff member by ID
-            staff = Staff.query.get(id)
+            staff = staff_payload(id)
             if not staff:
                 return {"message": "Staff member not found"}, 404
-            return staff.to_dict(), 200
+            return staff[0], 200
 
     @jwt_required()
     def post(self):
@@ -222,7 +263,7 @@ class StaffResource(Resource):
             )
             db.session.add(new_staff)
             db.session.commit()
-            return {"message": "Staff added successfully!", "staff": new_staff.to_dict()}, 201
+            return {"message": "Staff added successfully!", "staff": staff_payload(new_staff.id)[0]}, 201
         except Exception as e:
             return {"message": str(e)}, 500
 
@@ -249,7 +290,7 @@ class StaffResource(Resource):
 
         try:
             db.session.commit()
-            return {"message": "Staff updated successfully!", "staff": staff.to_dict()}, 200
+            return {"message": "Staff updated successfully!", "staff": staff_payload(staff.id)[0]}, 200
         except Exception as e:
             return {"message": str(e)}, 500        
 
@@ -298,13 +339,7 @@ class ReviewResource(Resource):
 
         return {
             "message": "Review submitted successfully",
-            "review": {
-                "id": new_review.id,
-                "staff_id": new_review.staff_id,
-                "client_id": new_review.client_id,
-                "rating": new_review.rating,
-                "review": new_review.review
-            }
+            "review": REVIEW.dump_obj(new_review)
         }, 200
 
     def put(self, review_id):
@@ -332,60 +367,58 @@ class ReviewResource(Resource):
 
         return {
             "message": "Review updated successfully",
-            "review": {
-                "id": review.id,
-                "staff_id": review.staff_id,
-                "client_id": review.client_id,
-                "rating": review.rating,
-                "review": review.review
-            }
+            "review": REVIEW.dump_obj(review)
         }, 200  
 
 
 class StaffReviewsResource(Resource):
+    @conditional(Staff, Review, User)
     def get(self):
-        staff_list = Staff.query.all()
-        
+        # Two queries: every review with its client's name, then the staff rows
+        reviews = {}
+        query = STAFF_REVIEW.select().outerjoin(User, User.id == Review.client_id).order_by(Review.id)
+        for review in STAFF_REVIEW.all(query):
+            reviews.setdefault(review.pop("staff_id"), []).append(review)
+
         staff_reviews = []
-        for staff in staff_list:
-            reviews = [
-                {
-                    "rating": review.rating,
-                    "review": review.review,
-                    "client": review.client.name
-                } 
-                for review in staff.reviews
-            ]
-            
+        for staff_id, name, picture, role in db.session.query(Staff.id, Staff.name, Staff.picture, Staff.role).order_by(Staff.id):
+            member_reviews = reviews.get(staff_id, [])
             staff_reviews.append({
-                "id": staff.id,
-                "name": staff.name,
-                "picture": staff.picture,
-                "role": staff.role,
-                "average_rating": staff.average_rating,
-                "reviews": reviews
+                "id": staff_id,
+                "name": name,
+                "picture": picture,
+                "role": role,
+                "average_rating": sum(r["rating"] for r in member_reviews) / len(member_reviews) if member_reviews else None,
+                "reviews": member_reviews
             })
 
-        return jsonify(staff_reviews)
+        return staff_reviews
 
 # Register the resource
 class TransactionResource(Resource):
+    @conditional(Transaction, TransactionArchive, Service, Staff, User)
     def get(self):
-        transactions = Transaction.query.all()
-        result = []
-
-        for transaction in transactions:
-            result.append({
-                "id": transaction.id,
-                "service_name": transaction.service.name if transaction.service else "Unknown",
-                "staff_name": transaction.staff.name if transaction.staff else "Unknown",
-                "client_name": transaction.client.name if transaction.client else transaction.client_name,
-                "amount_paid": transaction.amount_paid,
-                "time_taken": transaction.time_taken,
-                "booking_time": transaction.booking_time.isoformat() if transaction.booking_time else None,
-            })
+        """
+        Retrieve transactions, optionally limited to ?start=...&end=... (ISO dates).
+        Archived transactions are only read when `start` is older than the hot horizon.
+        """
+        try:
+            start = datetime.fromisoformat(request.args["start"]) if request.args.get("start") else None
+            end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        except ValueError:
+            return {"error": "Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+
+        rows = transaction_rows(start, end)
+        query = (
+            TRANSACTION_LIST.select(rows)
+            .outerjoin(Service, Service.id == rows.c.service_id)
+            .outerjoin(Staff, Staff.id == rows.c.staff_id)
+            .outerjoin(User, User.id == rows.c.client_id)
+            .order_by(rows.c.id)
+        )
+        return TRANSACTION_LIST.all(query)
 
-        return jsonify(result)
+    @idempotent
     def post(self):
         data = request.get_json()
 
@@ -401,14 +434,19 @@ class TransactionResource(Resource):
         if not service_id or not staff_id or not client_name or amount_paid is None or time_taken is None:
             return {"error": "Missing required fields"}, 400
 
-        # Ensure service exists
-        service = Service.query.get(service_id)
-        if not service:
+        try:
+            service_id = int(service_id)
+        except (TypeError, ValueError):
+            return {"error": "service_id must be an integer"}, 400
+
+        # Ensure service exists and validate amount paid, from the cached price history
+        price = price_at(service_id)
+        if price is None or amount_paid != price:
+            price = price_at(service_id, reload=True)  # Another worker may have changed it
+        if price is None:
             return {"error": "Service not found"}, 404
-
-        # Validate amount paid
-        if amount_paid != service.price:
-            return {"error": f"Incorrect amount. Expected: {service.price}, Received: {amount_paid}"}, 400
+        if amount_paid != price:
+            return {"error": f"Incorrect amount. Expected: {price}, Received: {amount_paid}"}, 400
 
         # Ensure staff exists
         staff = Staff.query.get(staff_id)
@@ -430,7 +468,6 @@ class TransactionResource(Resource):
                 client_name=client_name.strip(),  # Ensure not null
                 amount_paid=amount_paid,
                 time_taken=time_taken,
-                booking_time=datetime.utcnow(),
             )
 
             db.session.add(new_transaction)
@@ -444,28 +481,32 @@ class TransactionResource(Resource):
 class AdminMembers(Resource):
    
     def get(self):
-        # Get all members (users with role="user")
-        members = User.query.filter_by(role="user").all()
+        # Get all members (users with role="user"); visit counts come from the maintained user_stats rows
+        members = (
+            db.session.query(User.id, User.name, User.email, UserStats.transaction_count)
+            .outerjoin(UserStats, UserStats.user_id == User.id)
+            .filter(User.role == "user")
+            .all()
+        )
         total_members = len(members)
 
         # Prepare response data
-        member_data = []
-        for member in members:
-            # Count how many times they have been served
-            visit_count = db.session.query(Transaction).filter_by(client_id=member.id).count()
-
-            member_data.append({
-                "id": member.id,
-                "name": member.name,
-                "email": member.email,
-                "total_visits": visit_count
-            })
+        member_data = [
+            {
+                "id": member_id,
+                "name": name,
+                "email": email,
+                "total_visits": visit_count or 0
+            }
+            for member_id, name, email, visit_count in members
+        ]
 
         return jsonify({"total_members": total_members, "members": member_data})
 
 
 class BookingResource(Resource):
     @jwt_required()
+    @idempotent
     def post(self):
         """
         Create a new booking.
@@ -495,11 +536,13 @@ class BookingResource(Resource):
             return {"error": "Service not found"}, 404
         if not staff:
             return {"error": "Staff not found"}, 404
+        if not is_qualified(staff_id, service_id):
+            return {"error": "Staff does not offer this service"}, 400
 
-        # Check if the staff is already booked at the same time
-        existing_booking = Booking.query.filter_by(staff_id=staff_id, booking_time=booking_time).first()
-        if existing_booking:
-            return {"error": "Staff is already booked at this time"}, 400
+        # Check if the staff is already booked for any part of the service
+        if Booking.find_conflict([(staff_id, booking_time, booking_time + timedelta(hours=service.time_taken))]) is not None:
+            return {"error": "Staff is already booked at this time",
+                    "waitlist": "POST /waitlist to get this slot if it frees up"}, 400
 
         # Create new booking
         new_booking = Booking(
@@ -515,25 +558,118 @@ class BookingResource(Resource):
         return {"message": "Booking successful", "booking_id": new_booking.id}, 201
 
     @jwt_required()
+    @conditional(Booking, Service, Staff, User)
     def get(self):
         """
         Retrieve all bookings.
         """
-        bookings = Booking.query.all()
-        return jsonify([
-            {
-                "id": booking.id,
-                "service": booking.service.name,
-                "staff": booking.staff.name,
-                "user": booking.user.username,
-                "booking_time": booking.booking_time.isoformat()
-            }
-            for booking in bookings
+        query = (
+            BOOKING_LIST.select()
+            .join(Service, Service.id == Booking.service_id)
+            .join(Staff, Staff.id == Booking.staff_id)
+            .join(User, User.id == Booking.user_id)
+            .order_by(Booking.id)
+        )
+        return BOOKING_LIST.all(query)
+
+
+class BookingCancelResource(Resource):
+    @jwt_required()
+    def post(self, booking_id):
+        """
+        Cancel a booking. A future slot goes straight to the first fitting waitlist entry.
+        """
+        booking = db.session.get(Booking, booking_id)
+        if booking is None or (str(booking.user_id) != get_jwt_identity() and get_jwt().get("role") != "admin"):
+            return {"error": "Booking not found"}, 404
+        if booking.status not in BOOKING_ACTIVE_STATUSES:
+            return {"error": f"Booking is already {booking.status}"}, 400
+
+        booking.status = "canceled"
+        refilled = None
+        if booking.booking_time > datetime.utcnow():
+            end = booking.booking_time + timedelta(hours=booking.service.time_taken)
+            refilled = fill_slot(booking.staff, booking.booking_time, end)
+        db.session.commit()
+
+        return {"message": "Booking canceled", "slot_refilled": refilled is not None}, 200
+
+
+MAX_BATCH_BOOKINGS = 10
+
+
+class BookingBatchResource(Resource):
+    @jwt_required()
+    @idempotent
+    def post(self):
+        """
+        Create several bookings in one request, e.g. a haircut plus braiding.
+        Either every booking is saved or none is.
+        """
+        data = request.get_json() or {}
+        user_id = get_jwt_identity()  # Get logged-in user ID
+        items = data.get("items")
+
+        if not isinstance(items, list) or not items:
+            return {"error": "items must be a non-empty list"}, 400
+        if len(items) > MAX_BATCH_BOOKINGS:
+            return {"error": f"At most {MAX_BATCH_BOOKINGS} bookings per request"}, 400
+
+        # Validate required fields and convert booking_time from string to datetime
+        requested = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not all([item.get("service_id"), item.get("staff_id"), item.get("booking_time")]):
+                return {"error": f"Item {index}: Missing required fields"}, 400
+            try:
+                booking_time = datetime.fromisoformat(item["booking_time"])
+            except (TypeError, ValueError):
+                return {"error": f"Item {index}: Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+            requested.append((item["service_id"], item["staff_id"], booking_time))
+
+        # Load every referenced service and staff member at once
+        services = {s.id: s for s in Service.query.filter(Service.id.in_({r[0] for r in requested}))}
+        staff = {s.id: s for s in Staff.query.filter(Staff.id.in_({r[1] for r in requested}))}
+
+        for index, (service_id, staff_id, _) in enumerate(requested):
+            if service_id not in services:
+                return {"error": f"Item {index}: Service not found"}, 404
+            if staff_id not in staff:
+                return {"error": f"Item {index}: Staff not found"}, 404
+            if not is_qualified(staff_id, service_id):
+                return {"error": f"Item {index}: Staff does not offer this service"}, 400
+
+        # Check every interval against each other and existing bookings in one pass
+        conflict = Booking.find_conflict([
+            (staff_id, booking_time, booking_time + timedelta(hours=services[service_id].time_taken))
+            for service_id, staff_id, booking_time in requested
         ])
+        if conflict is not None:
+            return {"error": f"Item {conflict}: Staff is already booked at this time"}, 400
+
+        new_bookings = [
+            Booking(service_id=service_id, staff_id=staff_id, user_id=user_id, booking_time=booking_time)
+            for service_id, staff_id, booking_time in requested
+        ]
+        db.session.add_all(new_bookings)
+        db.session.commit()
+
+        return {"message": "Bookings successful", "booking_ids": [booking.id for booking in new_bookings]}, 201
 
 
 class Logout(Resource):
     def post(self):
+        # Revoke the current token if there is one, so a copied cookie stops working
+        try:
+            if verify_jwt_in_request(optional=True):
+                revoke_token(get_jwt())
+        except (JWTExtendedException, PyJWTError):
+            pass  # Expired or invalid tokens are already useless; just clear the cookies
+        try:
+            if verify_jwt_in_request(optional=True, refresh=True):
+                revoke_refresh_family(get_jwt()["fam"])
+        except (JWTExtendedException, PyJWTError, KeyError):
+            pass
+
         response = jsonify({"message": "Logout successful"})
         unset_jwt_cookies(response)
         return response
@@ -546,16 +682,40 @@ api.add_resource(ClearSession, '/clear_session')
 api.add_resource(Signup, '/signup')
 api.add_resource(CheckSession, '/check_session')
 api.add_resource(Login, '/login')
+api.add_resource(RefreshToken, '/refresh')
 api.add_resource(Logout, '/logout')
+api.add_resource(BranchListResource, "/branches")
 api.add_resource(ServiceResource, "/services", endpoint="services_list")  
 api.add_resource(ServiceResource, "/services/<int:service_id>", endpoint="service_detail")  
+api.add_resource(ServicePriceResource, "/services/<int:service_id>/prices")
+api.add_resource(ServiceRecommendationsResource, "/services/<int:service_id>/recommendations")
 api.add_resource(StaffResource, "/staff", "/staff/<int:id>")
 api.add_resource(StaffReviewsResource, "/staff/reviews")
+api.add_resource(ServiceStaffResource, "/services/<int:service_id>/staff")
+api.add_resource(StaffServicesResource, "/staff/<int:staff_id>/services")
+api.add_resource(StaffServiceLinkResource, "/staff/<int:staff_id>/services/<int:service_id>")
 api.add_resource(TransactionResource, "/transactions")
 api.add_resource(ReportsResource, "/reports")
+api.add_resource(ForecastResource, "/reports/forecast")
 api.add_resource(AdminMembers, "/admin/members")
+api.add_resource(AuditLogResource, "/admin/audit")
+api.add_resource(ProfileListResource, "/admin/profiles")
+api.add_resource(ProfileResource, "/admin/profiles/<string:profile_id>")
+api.add_resource(LoadResource, "/admin/load")
+api.add_resource(ReminderStatusResource, "/admin/reminders")
+api.add_resource(MediaUploadResource, "/media")
+api.add_resource(MediaResource, "/media/<string:name>", "/media/<string:name>/<int:size>")
+api.add_resource(SearchResource, "/search")
 
 api.add_resource(BookingResource, "/bookings")
+api.add_resource(BookingBatchResource, "/bookings/batch")
+api.add_resource(BookingCancelResource, "/bookings/<int:booking_id>/cancel")
+api.add_resource(WaitlistResource, "/waitlist")
+api.add_resource(WaitlistEntryResource, "/waitlist/<int:entry_id>")
+
+# Customer history
+api.add_resource(UserHistoryResource, "/users/<int:user_id>/history")
+api.add_resource(UserHistoryListResource, "/users/<int:user_id>/history/<string:kind>", "/bookings/user/<int:user_id>")
 
 
 # Review Endpoints
@@ -564,4 +724,5 @@ api.add_resource(StaffReviewsResource, "/reviews/<int:staff_id>", endpoint="revi
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=10000) 
+    from config import create_app
+    create_app().run(host="0.0.0.0", port=10000) 
@@ -0,0 +1,167 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, insert, select, union_all, update
+
+from extensions import db
+from models import Service, Staff, Transaction, TransactionArchive, TransactionRollup, User
+from scheduler import scheduler
+
+TRANSACTION_COLUMNS = [
+    "id", "service_id", "staff_id", "client_id", "client_name",
+    "amount_paid", "time_taken", "booking_time", "completed_at", "branch_id",
+]
+
+
+def hot_cutoff(now=None):
+    """Everything booked at or after this moment is guaranteed to still be in `transactions`."""
+    return (now or datetime.utcnow()) - timedelta(days=current_app.config["TRANSACTION_HOT_DAYS"])
+
+
+def _month(booking_time):
+    return date(booking_time.year, booking_time.month, 1)
+
+
+def archive_transactions(now=None, batch_size=None):
+    """Move transactions older than the hot horizon into `transactions_archive`, rolling them up by month."""
+    cutoff = hot_cutoff(now)
+    batch_size = batch_size or current_app.config["TRANSACTION_ARCHIVE_BATCH_SIZE"]
+    archived = 0
+
+    while True:
+        rows = db.session.execute(
+            select(Transaction.id, Transaction.staff_id, Transaction.service_id,
+                   Transaction.amount_paid, Transaction.booking_time, Transaction.branch_id)
+            .where(Transaction.booking_time < cutoff)
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        totals = defaultdict(lambda: [0, 0.0, None])
+        for row in rows:
+            key = (_month(row.booking_time), row.staff_id, row.service_id)
+            totals[key][0] += 1
+            totals[key][1] += row.amount_paid
+            totals[key][2] = row.branch_id  # Staff belong to one branch, so this is the same for the whole key
+
+        for key, (count, revenue, branch_id) in totals.items():
+            rollup = db.session.get(TransactionRollup, key)
+            if rollup is None:
+                rollup = TransactionRollup(month=key[0], staff_id=key[1], service_id=key[2], branch_id=branch_id,
+                                           transaction_count=0, revenue=0.0)
+                db.session.add(rollup)
+            rollup.transaction_count += count
+            rollup.revenue += revenue
+
+        ids = [row.id for row in rows]
+        db.session.execute(
+            insert(TransactionArchive).from_select(
+                TRANSACTION_COLUMNS,
+                select(*(getattr(Transaction, column) for column in TRANSACTION_COLUMNS)).where(Transaction.id.in_(ids)),
+            )
+        )
+        db.session.execute(
+            delete(Transaction).where(Transaction.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        archived += len(ids)
+
+    return archived
+
+
+@event.listens_for(db.session, "before_flush")
+def _delete_archived(session, flush_context, instances):
+    """
+    Archived transactions go with their staff member, service or client, as
+    hot ones do through the relationship cascades. Rollups go with their staff
+    member or service, and lose a deleted client's share.
+    """
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Staff, Service, User))]
+    if not deleted:
+        return
+
+    # Core statements on the flush's connection: they run before the parent rows' DELETE
+    connection = session.connection()
+    archive, rollups = TransactionArchive.__table__, TransactionRollup.__table__
+    for obj in deleted:
+        if isinstance(obj, User):
+            totals = defaultdict(lambda: [0, 0.0])
+            for row in connection.execute(
+                select(archive.c.staff_id, archive.c.service_id, archive.c.amount_paid, archive.c.booking_time)
+                .where(archive.c.client_id == obj.id)
+            ):
+                key = (_month(row.booking_time), row.staff_id, row.service_id)
+                totals[key][0] += 1
+                totals[key][1] += row.amount_paid
+            for (month, staff_id, service_id), (count, revenue) in totals.items():
+                connection.execute(
+                    update(rollups)
+                    .where(rollups.c.month == month, rollups.c.staff_id == staff_id, rollups.c.service_id == service_id)
+                    .values(transaction_count=rollups.c.transaction_count - count, revenue=rollups.c.revenue - revenue)
+                )
+            connection.execute(delete(archive).where(archive.c.client_id == obj.id))
+            connection.execute(delete(rollups).where(rollups.c.transaction_count <= 0))
+        else:
+            column = "staff_id" if isinstance(obj, Staff) else "service_id"
+            connection.execute(delete(archive).where(archive.c[column] == obj.id))
+            connection.execute(delete(rollups).where(rollups.c[column] == obj.id))
+
+
+def transaction_rows(start=None, end=None):
+    """
+    Subquery over transactions booked in [start, end). The archive is only
+    unioned in when `start` reaches back past the hot horizon.
+    """
+    def ranged(model):
+        query = select(*(getattr(model, column) for column in TRANSACTION_COLUMNS))
+        if start is not None:
+            query = query.where(model.booking_time >= start)
+        if end is not None:
+            query = query.where(model.booking_time < end)
+        return query
+
+    if start is not None and start >= hot_cutoff():
+        return ranged(Transaction).subquery("transaction_rows")
+    return union_all(ranged(Transaction), ranged(TransactionArchive)).subquery("transaction_rows")
+
+
+def revenue_query(start):
+    rows = transaction_rows(start=start)
+    return select(func.sum(rows.c.amount_paid))
+
+
+def revenue_since(start):
+    return db.session.execute(revenue_query(start)).scalar() or 0
+
+
+def all_time_counts(column):
+    """All-time transaction counts grouped by `staff_id` or `service_id`: hot rows plus archived rollups."""
+    hot = select(getattr(Transaction, column).label("key"), func.count(Transaction.id).label("count")) \
+        .group_by(getattr(Transaction, column))
+    cold = select(getattr(TransactionRollup, column).label("key"),
+                  func.sum(TransactionRollup.transaction_count).label("count")) \
+        .group_by(getattr(TransactionRollup, column))
+    return union_all(hot, cold).subquery(f"{column}_counts")
+
+
+def run_transaction_archive():
+    archived = archive_transactions()
+    current_app.logger.info("Transaction archive: %s rows moved", archived)
+    return archived
+
+
+@click.command("archive-transactions")
+@with_appcontext
+def archive_transactions_command():
+    """Move transactions older than TRANSACTION_HOT_DAYS into the archive table."""
+    click.echo(f"archived: {archive_transactions()}")
+
+
+def init_app(app):
+    app.cli.add_command(archive_transactions_command)
+    scheduler.add_job("transaction_archive", run_transaction_archive, app.config["TRANSACTION_ARCHIVE_INTERVAL"])
@@ -0,0 +1,211 @@
+"""
+Async serving mode: `uvicorn asgi:application --workers 2`.
+
+Hot read endpoints are answered natively on the event loop through an async
+SQLAlchemy engine, so many of them can wait on the database at once. Every
+other route is handed to the regular Flask app through asgiref's WSGI bridge,
+which runs it in a thread pool, so bcrypt in /login and /signup never blocks
+the loop. Needs `uvicorn`, `asgiref` and an async driver (`aiosqlite` or
+`asyncpg`).
+
+The native routes get what the Flask hooks give their Flask twins: a slot
+from the same admission gate, the same request metrics (labelled with the
+twin's Resource), its ETag and 304s, and gzip/brotli compression.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import parse_accept_header, parse_etags
+
+from admission import SHED, priority_of
+from branches import BRANCH_HEADER
+from extensions import db
+from http_cache import choose_encoding, compress, etag_for, versions_query
+from metrics import REQUEST_LATENCY, REQUESTS, cache_lookup
+from wsgi import app
+from models import Review, Service, Staff, User
+from reports import report_statements, report_value
+from serializers import SERVICE, STAFF, STAFF_RELATED, STAFF_REVIEW, dumps
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+wsgi_application = WsgiToAsgi(app)
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        url = os.getenv("ASYNC_DATABASE_URI")
+        if not url:
+            # Reuse the sync engine's resolved URL (Flask-SQLAlchemy moves relative SQLite paths into instance/)
+            with app.app_context():
+                sync_url = db.engine.url
+            url = sync_url.set(drivername=ASYNC_DRIVERS.get(sync_url.get_backend_name(), sync_url.drivername))
+        _engine = create_async_engine(url, pool_pre_ping=True)
+    return _engine
+
+
+async def list_services(conn):
+    return SERVICE.dump(await conn.execute(SERVICE.select().order_by(Service.id)))
+
+
+async def list_staff(conn):
+    """Same payload as `serializers.staff_payload()`, on the async engine."""
+    staff = STAFF.dump(await conn.execute(STAFF.select().order_by(Staff.id)))
+    for name, (key, column) in STAFF_RELATED.items():
+        grouped = defaultdict(list)
+        for staff_id, value in await conn.execute(select(key, column).order_by(column)):
+            grouped[staff_id].append(value)
+        for member in staff:
+            member[name] = grouped.get(member["id"], [])
+    return staff
+
+
+async def list_staff_reviews(conn):
+    reviews = defaultdict(list)
+    query = STAFF_REVIEW.select().outerjoin(User, User.id == Review.client_id).order_by(Review.id)
+    for review in STAFF_REVIEW.dump(await conn.execute(query)):
+        reviews[review.pop("staff_id")].append(review)
+
+    result = []
+    for row in await conn.execute(select(Staff.id, Staff.name, Staff.picture, Staff.role).order_by(Staff.id)):
+        staff_reviews = reviews.get(row.id, [])
+        result.append({
+            "id": row.id,
+            "name": row.name,
+            "picture": row.picture,
+            "role": row.role,
+            "average_rating": sum(r["rating"] for r in staff_reviews) / len(staff_reviews) if staff_reviews else None,
+            "reviews": staff_reviews,
+        })
+    return result
+
+
+async def build_report(conn):
+    with app.app_context():  # The statements read config (archive.hot_cutoff)
+        statements = report_statements(datetime.utcnow())
+    return {field: report_value(field, await conn.execute(statement)) for field, statement in statements.items()}
+
+
+# Path -> (handler, endpoint of the Flask route it answers for)
+ASYNC_ROUTES = {
+    "/services": (list_services, "api.services_list"),
+    "/staff": (list_staff, "api.staffresource"),
+    "/staff/reviews": (list_staff_reviews, "api.staffreviewsresource"),
+    "/reports": (build_report, "api.reportsresource"),
+}
+
+
+def _cors_headers(scope):
+    # Mirror the Flask-CORS setup in config.py (any origin, with credentials)
+    origin = dict(scope["headers"]).get(b"origin")
+    if not origin:
+        return []
+    return [
+        (b"access-control-allow-origin", origin),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+def _branch_scoped(scope):
+    # Branch filters are applied by session events (branches.py), so those requests take the Flask path
+    return b"x-branch-id" in dict(scope["headers"]) or b"branch=" in scope.get("query_string", b"")
+
+
+async def _send(scope, send, status, body, headers):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-length", str(len(body)).encode())] + headers + _cors_headers(scope),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _serve(scope, handler, tables):
+    """Status, body and headers for a native GET, as the Flask route's decorators and hooks would give them."""
+    request_headers = dict(scope["headers"])
+    headers = [(b"content-type", b"application/json")]
+    vary = []
+    async with get_engine().connect() as conn:
+        if tables is not None:  # http_cache.conditional
+            versions = dict((await conn.execute(versions_query(tables))).all())
+            full_path = f"{scope['path']}?{scope.get('query_string', b'').decode('latin-1')}"
+            tag = etag_for(full_path, None, tables, versions)  # Branch-scoped requests take the Flask path
+            headers += [(b"etag", f'W/"{tag}"'.encode()), (b"cache-control", b"no-cache")]
+            vary.append(BRANCH_HEADER)
+            revalidated = parse_etags(request_headers.get(b"if-none-match", b"").decode("latin-1")).contains_weak(tag)
+            cache_lookup("etag", revalidated)
+            if revalidated:
+                return 304, b"", headers[1:] + [(b"vary", BRANCH_HEADER.encode())]
+        payload = await handler(conn)
+
+    # http_cache.compress_response
+    body = dumps(payload)
+    vary.append("Accept-Encoding")
+    encoding = choose_encoding(parse_accept_header(request_headers.get(b"accept-encoding", b"").decode("latin-1")))
+    if encoding is not None and len(body) >= app.config["COMPRESSION_MIN_SIZE"]:
+        body = compress(body, encoding, app.config["COMPRESSION_LEVEL"])
+        headers.append((b"content-encoding", encoding.encode()))
+    return 200, body, headers + [(b"vary", ", ".join(vary).encode())]
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_engine()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _engine is not None:
+                await _engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    route = ASYNC_ROUTES.get(scope.get("path", "").rstrip("/") or "/")
+    if scope["type"] != "http" or scope["method"] != "GET" or route is None or _branch_scoped(scope):
+        return await wsgi_application(scope, receive, send)
+
+    handler, endpoint = route
+    view_class = app.view_functions[endpoint].view_class
+    resource = view_class.__name__
+    json_headers = [(b"content-type", b"application/json")]
+    status = 500
+    started = time.perf_counter()  # metrics: queueing for a slot counts, as in the Flask hooks
+    try:
+        gate = app.extensions.get("admission")
+        priority = priority_of(resource, "GET")
+        if gate is not None:
+            # Gate.admit waits on a threading.Condition, so never on the loop itself
+            retry_after = await asyncio.to_thread(gate.admit, priority, resource)
+            if retry_after is not None:
+                SHED.labels(priority).inc()
+                status = 503
+                return await _send(scope, send, status, dumps({"error": "The server is busy, please try again shortly"}),
+                                   json_headers + [(b"retry-after", str(max(1, math.ceil(retry_after))).encode())])
+
+        admitted = time.perf_counter()
+        try:
+            status, body, headers = await _serve(scope, handler, getattr(view_class.get, "etag_tables", None))
+        except Exception as e:
+            status, body, headers = 500, dumps({"error": str(e)}), json_headers
+        finally:
+            if gate is not None:
+                gate.release(priority, resource, time.perf_counter() - admitted)
+        await _send(scope, send, status, body, headers)
+    finally:
+        REQUESTS.labels(resource, "GET", status).inc()
+        REQUEST_LATENCY.labels(resource, "GET").observe(time.perf_counter() - started)
@@ -0,0 +1,200 @@
+import atexit
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_restful import Resource
+from jwt.exceptions import PyJWTError
+from sqlalchemy import event, inspect, insert, select
+
+from extensions import db
+from models import AuditEvent, Service, Staff, StaffService, Transaction
+from utils import role_required
+
+# Models whose inserts, updates and deletes are recorded
+AUDITED_MODELS = (Service, Staff, StaffService, Transaction)
+
+MAX_PER_PAGE = 200
+
+# Committed events waiting to be written. A batch goes out when it reaches
+# AUDIT_BATCH_SIZE, when AUDIT_FLUSH_INTERVAL has passed, and at shutdown,
+# always on a background thread so requests never wait on the audit insert.
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _actor_id():
+    if not has_request_context():
+        return None
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except (JWTExtendedException, PyJWTError):
+        return None
+    return int(identity) if identity is not None else None
+
+
+def _columns(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+
+def _changes(obj):
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            changes[attr.key] = [old, new]
+    return changes
+
+
+def _entity_id(obj):
+    return ":".join(str(value) for value in inspect(obj).mapper.primary_key_from_instance(obj))
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect(session, flush_context):
+    """Note changes to audited rows; they only reach the buffer if the transaction commits."""
+    events = []
+    for action, objects in (("create", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, AUDITED_MODELS):
+                continue
+            changes = _changes(obj) if action == "update" else _columns(obj)
+            if action == "update" and not changes:
+                continue
+            events.append({
+                "action": action,
+                "entity": obj.__tablename__,
+                "entity_id": _entity_id(obj),
+                "changes": json.dumps(changes, default=str),
+            })
+    if events:
+        actor_id = _actor_id()
+        for audit_event in events:
+            audit_event["actor_id"] = actor_id
+        session.info.setdefault("audit_events", []).extend(events)
+
+
+@event.listens_for(db.session, "after_commit")
+def _enqueue(session):
+    events = session.info.pop("audit_events", None)
+    if not events:
+        return
+    now = datetime.utcnow()
+    for audit_event in events:
+        audit_event["created_at"] = now
+    with _buffer_lock:
+        first = not _buffer
+        _buffer.extend(events)
+        due = len(_buffer) >= current_app.config["AUDIT_BATCH_SIZE"] \
+            or time.monotonic() - _last_flush >= current_app.config["AUDIT_FLUSH_INTERVAL"]
+    app = current_app._get_current_object()
+    if due:
+        threading.Thread(target=_flush_in_context, args=(app,), name="audit-flush", daemon=True).start()
+    elif first:
+        # The buffer is this worker's own, so its timer is too (the scheduler runs in another process)
+        timer = threading.Timer(current_app.config["AUDIT_FLUSH_INTERVAL"], _flush_in_context, args=(app,))
+        timer.daemon = True
+        timer.start()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard(session):
+    session.info.pop("audit_events", None)
+
+
+def flush_audit_events():
+    """Write every buffered event in one multi-row INSERT. Returns how many were written."""
+    global _last_flush
+    with _buffer_lock:
+        events = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not events:
+        return 0
+
+    try:
+        # Own connection, so a flush never joins (or commits) a request's transaction
+        with db.engine.begin() as connection:
+            connection.execute(insert(AuditEvent.__table__), events)
+    except Exception:
+        with _buffer_lock:
+            # Put them back for the next attempt, keeping at most AUDIT_MAX_BUFFER
+            _buffer[:0] = events
+            dropped = len(_buffer) - current_app.config["AUDIT_MAX_BUFFER"]
+            if dropped > 0:
+                del _buffer[:dropped]
+        current_app.logger.exception("Audit flush failed; %s events still buffered", len(_buffer))
+        return 0
+    return len(events)
+
+
+def _flush_in_context(app):
+    with app.app_context():
+        flush_audit_events()
+
+
+def audit_events(actor_id=None, entity=None, entity_id=None, since=None, until=None, before=None, limit=50):
+    """Newest-first audit events matching the filters, with keyset pagination on id."""
+    query = select(AuditEvent).order_by(AuditEvent.id.desc()).limit(limit)
+    if actor_id is not None:
+        query = query.where(AuditEvent.actor_id == actor_id)
+    if entity is not None:
+        query = query.where(AuditEvent.entity == entity)
+    if entity_id is not None:
+        query = query.where(AuditEvent.entity_id == str(entity_id))
+    if since is not None:
+        query = query.where(AuditEvent.created_at >= since)
+    if until is not None:
+        query = query.where(AuditEvent.created_at < until)
+    if before is not None:
+        query = query.where(AuditEvent.id < before)
+    return db.session.scalars(query).all()
+
+
+class AuditLogResource(Resource):
+    @role_required("admin")
+    def get(self):
+        """Admin changes: /admin/audit?actor=3&entity=services&entity_id=1&since=...&until=...&before=<id>&limit=50"""
+        try:
+            actor_id = int(request.args["actor"]) if request.args.get("actor") else None
+            before = int(request.args["before"]) if request.args.get("before") else None
+            limit = min(max(int(request.args.get("limit", 50)), 1), MAX_PER_PAGE)
+        except ValueError:
+            return {"error": "actor, before and limit must be integers"}, 400
+        try:
+            since = datetime.fromisoformat(request.args["since"]) if request.args.get("since") else None
+            until = datetime.fromisoformat(request.args["until"]) if request.args.get("until") else None
+        except ValueError:
+            return {"error": "Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+
+        flush_audit_events()  # Include this worker's buffered events
+        events = audit_events(actor_id, request.args.get("entity"), request.args.get("entity_id"),
+                              since, until, before, limit)
+        return {
+            "events": [
+                {
+                    "id": audit_event.id,
+                    "created_at": audit_event.created_at.isoformat(),
+                    "actor_id": audit_event.actor_id,
+                    "action": audit_event.action,
+                    "entity": audit_event.entity,
+                    "entity_id": audit_event.entity_id,
+                    "changes": json.loads(audit_event.changes),
+                }
+                for audit_event in events
+            ],
+            "next_before": events[-1].id if len(events) == limit else None,
+        }
+
+
+def init_app(app):
+    atexit.register(_flush_in_context, app)
@@ -0,0 +1,93 @@
+"""
+Throughput and latency of the sync gunicorn setup against the async uvicorn one.
+
+    cd server
+    python benchmarks/asgi_vs_wsgi.py --requests 2000 --concurrency 32
+
+Both servers are started against the same database (SQLALCHEMY_DATABASE_URI,
+seed it first) and hit with the same mix of read endpoints.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "sync (gunicorn -w 4)": ["gunicorn", "-c", "gunicorn.conf.py", "-b", "127.0.0.1:{port}", "wsgi:app"],
+    "async (uvicorn -w 4)": ["uvicorn", "asgi:application", "--workers", "4", "--port", "{port}", "--log-level", "warning"],
+}
+
+PATHS = ["/services", "/staff", "/staff/reviews", "/reports"]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def timed_get(port, path):
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return time.perf_counter() - start, response.status
+
+
+def run(port, total, concurrency):
+    paths = [PATHS[i % len(PATHS)] for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda path: timed_get(port, path), paths))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status >= 500)
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    print(f"{'server':24} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'5xx':>5}")
+    for name, command in SERVERS.items():
+        process = subprocess.Popen(
+            [part.format(port=args.port) for part in command],
+            cwd=SERVER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(args.port)
+            run(args.port, min(200, args.requests), args.concurrency)  # Warm up pools and caches
+            stats = run(args.port, args.requests, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{name:24} {stats['rps']:9.1f} {stats['p50_ms']:9.1f} {stats['p99_ms']:9.1f} {stats['errors']:5d}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Cost of the demand forecast in forecasting.py over years of history.
+
+    cd server
+    python benchmarks/forecasting.py --years 3 --rows 1000000 --runs 5
+
+Times the vectorized pass (forecast_arrays) on synthetic arrays, then the
+whole path, database fetch included, against a throwaway in-memory SQLite
+database holding --db-rows transactions and as many bookings.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+
+from config import Config, create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Booking, Service, Staff, Transaction, User  # noqa: E402
+import forecasting  # noqa: E402
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+
+
+def synthetic(rows, days, staff_count, service_count, start):
+    rng = np.random.default_rng(1)
+    # Busier at the weekend and in the afternoon, like the shop
+    day = rng.integers(0, days, rows)
+    day = np.where(rng.random(rows) < 0.3, day - day % 7 + 5, day).clip(0, days - 1)
+    seconds = day * 86400 + rng.integers(9, 19, rows) * 3600
+    times = np.datetime64(start, "s") + seconds.astype("timedelta64[s]")
+    staff = rng.integers(1, staff_count + 1, rows)
+    service = rng.integers(1, service_count + 1, rows)
+    return (staff, service, times, rng.uniform(20, 120, rows)), (staff, service, times)
+
+
+def populate(rows, days, staff_count, service_count, start):
+    transactions, bookings = synthetic(rows, days, staff_count, service_count, start)
+    db.session.execute(insert(Service.__table__), [
+        {"id": i, "name": f"Service {i}", "price": 10.0 + i, "time_taken": 1.0} for i in range(1, service_count + 1)
+    ])
+    db.session.execute(insert(Staff.__table__), [
+        {"id": i, "name": f"Staff {i}", "gender": "other", "role": "stylist"} for i in range(1, staff_count + 1)
+    ])
+    db.session.execute(insert(User.__table__), [
+        {"id": 1, "name": "User", "username": "user", "email": "user@example.com", "_password_hash": "x", "role": "user"}
+    ])
+    staff, service, times, amounts = transactions
+    times = times.astype(datetime)
+    db.session.execute(insert(Transaction.__table__), [
+        {"service_id": int(service[i]), "staff_id": int(staff[i]), "client_id": 1, "client_name": "Walk-in",
+         "amount_paid": float(amounts[i]), "time_taken": 1.0, "booking_time": times[i]}
+        for i in range(rows)
+    ])
+    db.session.execute(insert(Booking.__table__), [
+        {"service_id": int(service[i]), "staff_id": int(staff[i]), "user_id": 1,
+         "booking_time": times[i], "status": random.choice(["completed", "completed", "canceled"])}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Transactions and bookings each, for the NumPy pass")
+    parser.add_argument("--db-rows", type=int, default=50_000, help="Transactions and bookings each, for the full path")
+    parser.add_argument("--staff", type=int, default=40)
+    parser.add_argument("--services", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(1)
+    days = args.years * 365
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=days)
+
+    transactions, bookings = synthetic(args.rows, days, args.staff, args.services, start)
+    print(f"{args.years} years, {args.staff * args.services} staff/service pairs, {args.rows:,} transactions + bookings")
+    for method in forecasting.METHODS:
+        ms = timed(lambda: forecasting.forecast_arrays(transactions, bookings, start, days, 14, method), args.runs)
+        print(f"  forecast_arrays {method:16} {ms:8.1f} ms")
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        populate(args.db_rows, days, args.staff, args.services, start)
+        print(f"full path against SQLite, {args.db_rows:,} transactions + bookings")
+        fetch = timed(lambda: forecasting.load_history(start, today), args.runs)
+        print(f"  load_history                     {fetch:8.1f} ms")
+        cold = timed(lambda: (forecasting.invalidate_forecasts(), forecasting.demand_forecast(days, 14)), args.runs)
+        print(f"  demand_forecast (cold)           {cold:8.1f} ms")
+        warm = timed(lambda: forecasting.demand_forecast(days, 14), args.runs)
+        print(f"  demand_forecast (cached)         {warm:8.1f} ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
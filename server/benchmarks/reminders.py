@@ -0,0 +1,113 @@
+"""
+Throughput of the reminder dispatcher in reminders.py as bookings per day grow.
+
+    cd server
+    python benchmarks/reminders.py --per-day 1000,5000,20000 --days 30
+
+For each volume, fills a throwaway in-memory SQLite database with --days of
+bookings, points REMINDER_TRANSPORT at a local webhook stand-in, and replays
+one day of dispatcher ticks. Reports the cost per tick and per reminder, and
+checks that the stand-in received every reminder exactly once.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, insert  # noqa: E402
+
+from config import Config, create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Booking, Reminder, Service, Staff, User  # noqa: E402
+import reminders  # noqa: E402
+
+received = Counter()
+
+
+class Sink(BaseHTTPRequestHandler):
+    """Local stand-in for a reminder webhook: counts the reminder ids it is sent."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        received.update(reminder["id"] for reminder in body["reminders"])
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def populate(per_day, days, start, users=500, staff_count=40, service_count=15):
+    db.session.execute(delete(Reminder))
+    db.session.execute(delete(Booking))
+    if db.session.get(User, 1) is None:
+        db.session.execute(insert(Service.__table__), [
+            {"id": i, "name": f"Service {i}", "price": 10.0 + i, "time_taken": 1.0} for i in range(1, service_count + 1)
+        ])
+        db.session.execute(insert(Staff.__table__), [
+            {"id": i, "name": f"Staff {i}", "gender": "other", "role": "stylist"} for i in range(1, staff_count + 1)
+        ])
+        db.session.execute(insert(User.__table__), [
+            {"id": i, "name": f"User {i}", "username": f"user{i}", "email": f"user{i}@example.com",
+             "_password_hash": "x", "role": "user"}
+            for i in range(1, users + 1)
+        ])
+    db.session.execute(insert(Booking.__table__), [
+        {"service_id": random.randint(1, service_count), "staff_id": random.randint(1, staff_count),
+         "user_id": random.randint(1, users), "status": random.choice(["pending", "confirmed", "confirmed", "canceled"]),
+         "booking_time": start + timedelta(days=day, seconds=random.randint(9 * 3600, 19 * 3600))}
+        for day in range(days) for _ in range(per_day)
+    ])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--per-day", default="1000,5000,20000", help="Comma-separated bookings per day to compare")
+    parser.add_argument("--days", type=int, default=30, help="Days of bookings in the table")
+    args = parser.parse_args()
+
+    sink = ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite://"
+        REMINDER_TRANSPORT = f"http://127.0.0.1:{sink.server_port}/reminders"
+
+    random.seed(1)
+    app = create_app(BenchConfig)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    interval = timedelta(seconds=app.config["REMINDER_INTERVAL"])
+    print(f"{args.days} days of bookings, one day of ticks every {interval.seconds}s, leads {app.config['REMINDER_LEAD_MINUTES']} min")
+    print(f"{'per day':>8} {'rows':>9} {'sent':>7} {'tick mean':>10} {'tick max':>9} {'per reminder':>13} {'dupes':>6}")
+    with app.app_context():
+        db.create_all()
+        for per_day in (int(value) for value in args.per_day.split(",")):
+            populate(per_day, args.days, start)
+            received.clear()
+            ticks, sent = [], 0
+            now = start
+            while now < start + timedelta(days=1):
+                began = time.perf_counter()
+                sent += reminders.dispatch_reminders(now)["sent"]
+                ticks.append(time.perf_counter() - began)
+                now += interval
+            dupes = sum(count - 1 for count in received.values())
+            missing = sent - len(received)
+            print(f"{per_day:>8,} {per_day * args.days:>9,} {sent:>7,} {statistics.mean(ticks) * 1000:>8.2f}ms "
+                  f"{max(ticks) * 1000:>7.1f}ms {sum(ticks) / max(sent, 1) * 1000:>11.3f}ms {dupes:>6}"
+                  + (f"  ({missing} not received)" if missing else ""))
+    sink.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Serialization cost of the list endpoints: the previous ORM-object paths
+(lazy relationship loads, hand-built dicts, stdlib json) against the
+schema-driven ones in serializers.py.
+
+    cd server
+    python benchmarks/serializers.py --transactions 5000 --runs 20
+
+Runs against a throwaway in-memory SQLite database, so it needs no seed.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+
+from config import Config, create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Booking, Review, Service, Staff, StaffService, Transaction, User  # noqa: E402
+import serializers  # noqa: E402
+from serializers import BOOKING_LIST, STAFF_REVIEW, TRANSACTION_LIST, dumps, staff_payload  # noqa: E402
+from archive import transaction_rows  # noqa: E402
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+
+
+def populate(staff_count, user_count, transaction_count):
+    now = datetime.utcnow()
+    db.session.execute(insert(Service.__table__), [
+        {"id": i, "name": f"Service {i}", "price": 10.0 + i, "time_taken": 1.0} for i in range(1, 11)
+    ])
+    db.session.execute(insert(Staff.__table__), [
+        {"id": i, "name": f"Staff {i}", "gender": "other", "role": "stylist"} for i in range(1, staff_count + 1)
+    ])
+    db.session.execute(insert(StaffService.__table__), [
+        {"staff_id": i, "service_id": s} for i in range(1, staff_count + 1) for s in range(1, 11) if (i + s) % 3 == 0
+    ])
+    db.session.execute(insert(User.__table__), [
+        {"id": i, "name": f"User {i}", "username": f"user{i}", "email": f"user{i}@example.com",
+         "_password_hash": "x", "role": "user"} for i in range(1, user_count + 1)
+    ])
+    db.session.execute(insert(Transaction.__table__), [
+        {"service_id": random.randint(1, 10), "staff_id": random.randint(1, staff_count),
+         "client_id": random.randint(1, user_count), "client_name": "Walk-in", "amount_paid": 20.0,
+         "time_taken": 1.0, "booking_time": now - timedelta(minutes=i)}
+        for i in range(transaction_count)
+    ])
+    db.session.execute(insert(Booking.__table__), [
+        {"service_id": random.randint(1, 10), "staff_id": random.randint(1, staff_count),
+         "user_id": random.randint(1, user_count), "booking_time": now + timedelta(hours=i), "status": "pending"}
+        for i in range(transaction_count // 2)
+    ])
+    db.session.execute(insert(Review.__table__), [
+        {"staff_id": random.randint(1, staff_count), "client_id": random.randint(1, user_count),
+         "rating": random.choice([3.0, 4.0, 5.0]), "review": "Nice"}
+        for i in range(transaction_count // 4)
+    ])
+    db.session.commit()
+
+
+# Previous implementations, kept here for comparison only
+
+def legacy_staff():
+    return json.dumps([
+        {
+            "id": staff.id, "name": staff.name, "picture": staff.picture,
+            "gender": staff.gender or "not specified", "role": staff.role or "not specified",
+            "services": [service.id for service in staff.services],
+            "reviews": [review.id for review in staff.reviews],
+            "transactions": [transaction.id for transaction in staff.transactions],
+            "bookings": [booking.id for booking in staff.bookings],
+        }
+        for staff in Staff.query.all()
+    ])
+
+
+def legacy_transactions():
+    rows = transaction_rows()
+    result = []
+    for transaction in (
+        db.session.query(rows, Service.name, Staff.name, User.name)
+        .outerjoin(Service, Service.id == rows.c.service_id)
+        .outerjoin(Staff, Staff.id == rows.c.staff_id)
+        .outerjoin(User, User.id == rows.c.client_id)
+        .order_by(rows.c.id)
+    ):
+        service_name, staff_name, user_name = transaction[-3:]
+        result.append({
+            "id": transaction.id,
+            "service_name": service_name or "Unknown",
+            "staff_name": staff_name or "Unknown",
+            "client_name": user_name or transaction.client_name,
+            "amount_paid": transaction.amount_paid,
+            "time_taken": transaction.time_taken,
+            "booking_time": transaction.booking_time.isoformat() if transaction.booking_time else None,
+        })
+    return json.dumps(result, sort_keys=True)
+
+
+def legacy_bookings():
+    return json.dumps([
+        {
+            "id": booking.id,
+            "service": booking.service.name,
+            "staff": booking.staff.name,
+            "user": booking.user.username,
+            "booking_time": booking.booking_time.isoformat(),
+        }
+        for booking in Booking.query.all()
+    ], sort_keys=True)
+
+
+def legacy_staff_reviews():
+    return json.dumps([
+        {
+            "id": staff.id, "name": staff.name, "picture": staff.picture, "role": staff.role,
+            "average_rating": staff.average_rating,
+            "reviews": [{"rating": r.rating, "review": r.review, "client": r.client.name} for r in staff.reviews],
+        }
+        for staff in Staff.query.all()
+    ], sort_keys=True)
+
+
+def schema_transactions():
+    rows = transaction_rows()
+    return dumps(TRANSACTION_LIST.all(
+        TRANSACTION_LIST.select(rows)
+        .outerjoin(Service, Service.id == rows.c.service_id)
+        .outerjoin(Staff, Staff.id == rows.c.staff_id)
+        .outerjoin(User, User.id == rows.c.client_id)
+        .order_by(rows.c.id)
+    ))
+
+
+def schema_bookings():
+    return dumps(BOOKING_LIST.all(
+        BOOKING_LIST.select()
+        .join(Service, Service.id == Booking.service_id)
+        .join(Staff, Staff.id == Booking.staff_id)
+        .join(User, User.id == Booking.user_id)
+        .order_by(Booking.id)
+    ))
+
+
+def schema_staff_reviews():
+    reviews = {}
+    query = STAFF_REVIEW.select().outerjoin(User, User.id == Review.client_id).order_by(Review.id)
+    for review in STAFF_REVIEW.all(query):
+        reviews.setdefault(review.pop("staff_id"), []).append(review)
+    return dumps([
+        {"id": staff_id, "name": name, "picture": picture, "role": role,
+         "average_rating": sum(r["rating"] for r in reviews.get(staff_id, [])) / len(reviews[staff_id])
+         if reviews.get(staff_id) else None,
+         "reviews": reviews.get(staff_id, [])}
+        for staff_id, name, picture, role in db.session.query(Staff.id, Staff.name, Staff.picture, Staff.role)
+    ])
+
+
+CASES = {
+    "/staff": (legacy_staff, lambda: dumps(staff_payload())),
+    "/transactions": (legacy_transactions, schema_transactions),
+    "/bookings": (legacy_bookings, schema_bookings),
+    "/staff/reviews": (legacy_staff_reviews, schema_staff_reviews),
+}
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        db.session.expunge_all()  # Each request starts with an empty identity map
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--staff", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(1)
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        populate(args.staff, args.users, args.transactions)
+
+        print(f"encoder: {'orjson' if serializers.orjson else 'json'}")
+        print(f"{'endpoint':16} {'legacy ms':>10} {'schema ms':>10} {'speedup':>8}")
+        for name, (legacy, schema) in CASES.items():
+            before, after = timed(legacy, args.runs), timed(schema, args.runs)
+            print(f"{name:16} {before:10.1f} {after:10.1f} {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Start-up time and memory of the app's entry points.
+
+    cd server
+    python benchmarks/startup.py
+
+Reports import time / peak RSS for scripts that only need part of the stack,
+then time-to-first-response and per-worker RSS/PSS for gunicorn with and
+without --preload.
+"""
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = {
+    "models only": "import models",
+    "seed script": "import seed",
+    "full app (wsgi)": "import wsgi",
+}
+
+# `-c /dev/null` keeps gunicorn from picking up ./gunicorn.conf.py (which preloads)
+GUNICORN = {
+    "gunicorn -w 4": ["gunicorn", "-c", "/dev/null", "-w", "4", "-b", "127.0.0.1:{port}", "wsgi:app"],
+    "gunicorn -w 4 --preload": ["gunicorn", "-c", "/dev/null", "-w", "4", "--preload", "-b", "127.0.0.1:{port}", "wsgi:app"],
+}
+
+
+def measure_import(statement, runs=5):
+    code = f"{statement}; import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    times, rss = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIR, capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        rss = int(output.stdout.split()[-1])
+    return statistics.median(times) * 1000, rss / 1024
+
+
+def memory_kb(pid):
+    """(RSS, PSS) in KB; PSS splits pages shared with the master, so it shows the real cost per worker."""
+    values = {}
+    for name in ("status", "smaps_rollup"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    key, _, rest = line.partition(":")
+                    if key in ("VmRSS", "Pss"):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+    return values.get("VmRSS", 0), values.get("Pss", 0)
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def measure_gunicorn(command, port=18090, workers=4):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [part.format(port=port) for part in command], cwd=SERVER_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/")
+                conn.getresponse().read()
+                break
+            except OSError:
+                time.sleep(0.05)
+        ready_ms = (time.perf_counter() - start) * 1000
+        while len(children(process.pid)) < workers:
+            time.sleep(0.05)
+        time.sleep(1)
+        worker_memory = [memory_kb(pid) for pid in children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+    rss = statistics.mean(m[0] for m in worker_memory) / 1024
+    pss = statistics.mean(m[1] for m in worker_memory) / 1024
+    return ready_ms, rss, pss
+
+
+def main():
+    print(f"{'entry point':26} {'time ms':>9} {'peak RSS MB':>12}")
+    for name, statement in IMPORTS.items():
+        elapsed, rss = measure_import(statement)
+        print(f"{name:26} {elapsed:9.0f} {rss:12.1f}")
+
+    print()
+    print(f"{'server':26} {'ready ms':>9} {'worker RSS MB':>14} {'worker PSS MB':>14}")
+    for name, command in GUNICORN.items():
+        ready, rss, pss = measure_gunicorn(command)
+        print(f"{name:26} {ready:9.0f} {rss:14.1f} {pss:14.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Branch scoping.
+
+A request picks a branch with the `X-Branch-Id` header (or `?branch=`). While
+it is set, every ORM select, update and delete on a `BranchScoped` model is
+limited to that branch, joins and relationship loads included, so handlers
+and reports need no branch filters of their own. Without it queries see every
+branch, as before. Pass `execution_options(all_branches=True)` to opt a
+statement out.
+"""
+from flask import g, has_request_context, jsonify, request
+from flask_restful import Resource
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import with_loader_criteria
+
+from extensions import db
+from models import Booking, Branch, BranchScoped, Staff, Transaction, WaitlistEntry
+from utils import role_required
+
+BRANCH_HEADER = "X-Branch-Id"
+
+
+def current_branch_id():
+    """The branch this request is scoped to, or None for all branches."""
+    return g.get("branch_id") if has_request_context() else None
+
+
+def _scope_request():
+    raw = request.headers.get(BRANCH_HEADER) or request.args.get("branch")
+    if not raw:
+        return None
+    try:
+        branch_id = int(raw)
+    except ValueError:
+        return jsonify({"error": "Branch id must be an integer"}), 400
+    # Set before the lookup so replica routing can already pick this branch's bind
+    g.branch_id = branch_id
+    if db.session.get(Branch, branch_id) is None:
+        g.pop("branch_id")
+        return jsonify({"error": "Branch not found"}), 404
+    return None
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _limit_to_branch(orm_execute_state):
+    branch_id = current_branch_id()
+    if (branch_id is None
+            or not (orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete)
+            or orm_execute_state.is_column_load or orm_execute_state.is_relationship_load
+            or orm_execute_state.execution_options.get("all_branches")):
+        return
+    orm_execute_state.statement = orm_execute_state.statement.options(
+        with_loader_criteria(BranchScoped, lambda cls: cls.branch_id == branch_id, include_aliases=True)
+    )
+
+
+@event.listens_for(db.session, "before_flush")
+def _assign_branch(session, flush_context, instances):
+    """New bookings, transactions and waitlist entries belong to their staff member's branch; other new rows to the request's."""
+    for obj in session.new:
+        if not isinstance(obj, BranchScoped) or obj.branch_id is not None:
+            continue
+        branch_id = None
+        if isinstance(obj, (Booking, Transaction, WaitlistEntry)):
+            staff = obj.staff
+            if staff is None and obj.staff_id is not None:
+                with session.no_autoflush:
+                    staff = session.get(Staff, obj.staff_id, execution_options={"all_branches": True})
+            branch_id = staff.branch_id if staff is not None else None
+        branch_id = branch_id or current_branch_id()
+        if branch_id is not None:  # Otherwise the column default, branch 1, applies
+            obj.branch_id = branch_id
+
+
+class BranchListResource(Resource):
+    def get(self):
+        return [
+            {"id": branch.id, "name": branch.name, "address": branch.address}
+            for branch in db.session.scalars(select(Branch).order_by(Branch.id))
+        ], 200
+
+    @role_required("admin")
+    def post(self):
+        data = request.get_json() or {}
+        if not data.get("name"):
+            return {"error": "Branch name is required"}, 400
+
+        branch = Branch(name=data["name"], address=data.get("address"))
+        db.session.add(branch)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "A branch with this name already exists"}, 400
+        return {"id": branch.id, "name": branch.name, "address": branch.address}, 201
+
+
+def init_app(app):
+    app.before_request(_scope_request)
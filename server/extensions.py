@@ -0,0 +1,12 @@
+from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager
+from flask_sqlalchemy import SQLAlchemy
+
+from replicas import RoutingSession
+
+# Created unbound so models and helpers can import them without building an app;
+# `config.create_app()` binds them. Flask-Migrate (and alembic behind it) is only
+# imported there, since nothing outside the `flask db` commands needs it.
+db = SQLAlchemy(session_options={"class_": RoutingSession})  # Reads may go to a replica, see replicas.py
+bcrypt = Bcrypt()
+jwt = JWTManager()
@@ -0,0 +1,236 @@
+"""
+Demand forecasting per staff/service pair.
+
+History is fetched once per range (one select per source: transactions with
+their archive, bookings with theirs) straight into NumPy arrays, and every
+pair is then forecast in the same vectorized pass:
+
+- a day-of-week factor per pair (mean of that weekday over the mean of all days)
+- the deseasonalized daily series smoothed to a level, either by simple
+  exponential smoothing (`ema`, one dot product with the decay weights) or a
+  trailing `moving_average`
+- forecast day d = level * factor[weekday(d)]
+- an hour-of-week profile (168 slots) for the busiest hours
+
+Results are cached per branch, parameters and day, and recomputed once
+bookings or transactions are written anywhere: their `table_versions` write
+counters (http_cache.py) move on every insert, status change, sweep or delete,
+whichever worker made it.
+"""
+from datetime import datetime, timedelta
+from threading import Lock
+
+import numpy as np
+from flask import request
+from flask_restful import Resource
+from sqlalchemy import event, extract, select, union_all
+
+from archive import transaction_rows
+from branches import current_branch_id
+from extensions import db
+from http_cache import table_names, track, versions_query
+from metrics import cache_lookup
+from models import Booking, BookingArchive, Transaction
+from utils import role_required
+
+METHODS = ("ema", "moving_average")
+HOURS_PER_WEEK = 7 * 24
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday; Monday is 0 as in datetime.weekday()
+
+DEMAND_TABLES = table_names(Booking, Transaction)
+track(DEMAND_TABLES)  # Counted even if no conditional GET depends on them
+
+_cache = {}   # (branch, history_days, horizon, method) -> ((today, data version), forecasts)
+_cache_lock = Lock()
+_alpha = 0.3  # Set from config in init_app()
+_window = 28
+
+
+def _weekdays(days):
+    return (days + EPOCH_WEEKDAY) % 7
+
+
+def _to_arrays(rows, value_column=False):
+    """Columns of (staff_id, service_id, epoch seconds[, value]) rows as arrays."""
+    columns = list(zip(*rows)) if rows else [(), (), ()] + ([()] if value_column else [])
+    arrays = [
+        np.array(columns[0], dtype=np.int64),
+        np.array(columns[1], dtype=np.int64),
+        np.array(columns[2], dtype=np.int64).astype("datetime64[s]"),
+    ]
+    if value_column:
+        arrays.append(np.array(columns[3], dtype=np.float64))
+    return arrays
+
+
+def load_history(start, end):
+    """
+    Transactions (staff, service, time, amount) and non-canceled bookings
+    (staff, service, time) booked in [start, end), as NumPy arrays.
+    """
+    # Epoch seconds rather than datetimes: the driver's datetime parsing would cost more than the forecast
+    rows = transaction_rows(start=start, end=end)
+    transactions = db.session.execute(
+        select(rows.c.staff_id, rows.c.service_id, extract("epoch", rows.c.booking_time), rows.c.amount_paid)
+    ).all()
+
+    def ranged(model):
+        return select(model.staff_id, model.service_id, extract("epoch", model.booking_time)).where(
+            model.booking_time >= start, model.booking_time < end, model.status != "canceled",
+        )
+    bookings = db.session.execute(union_all(ranged(Booking), ranged(BookingArchive))).all()
+    return _to_arrays(transactions, value_column=True), _to_arrays(bookings)
+
+
+def _seasonal_level(daily, first_day, method, alpha, window):
+    """Per-pair weekday factors and the smoothed deseasonalized level of a (pairs, days) matrix."""
+    days = daily.shape[1]
+    weekday = _weekdays(first_day + np.arange(days))
+    onehot = np.zeros((days, 7))
+    onehot[np.arange(days), weekday] = 1
+    weekday_means = (daily @ onehot) / np.maximum(onehot.sum(axis=0), 1)
+    overall = daily.mean(axis=1, keepdims=True)
+    factors = np.divide(weekday_means, overall, out=np.ones_like(weekday_means), where=overall > 0)
+
+    column_factors = factors[:, weekday]
+    deseasonalized = np.divide(daily, column_factors, out=np.zeros_like(daily), where=column_factors > 0)
+    if method == "moving_average":
+        level = deseasonalized[:, -window:].mean(axis=1)
+    else:
+        weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+        weights[0] = (1 - alpha) ** (days - 1)  # The series starts at its first value
+        level = deseasonalized @ weights
+    return factors, level
+
+
+def forecast_arrays(transactions, bookings, start, days, horizon, method="ema", alpha=0.3, window=28):
+    """
+    Forecast every staff/service pair seen in the history arrays (see
+    `load_history`) for the `horizon` days after the `days`-day range starting
+    at `start`. Returns the pairs and their forecast matrices.
+    """
+    t_staff, t_service, t_times, t_amounts = transactions
+    b_staff, b_service, b_times = bookings
+
+    keys, pair = np.unique(
+        np.concatenate([t_staff << 32 | t_service, b_staff << 32 | b_service]), return_inverse=True,
+    )
+    pairs = len(keys)
+    t_pair, b_pair = pair[:len(t_staff)], pair[len(t_staff):]
+
+    first_day = np.datetime64(start, "D").astype(np.int64)
+    t_day = t_times.astype("datetime64[D]").astype(np.int64) - first_day
+    b_day = b_times.astype("datetime64[D]").astype(np.int64) - first_day
+    revenue = np.bincount(t_pair * days + t_day, weights=t_amounts, minlength=pairs * days).reshape(pairs, days)
+    booked = np.bincount(b_pair * days + b_day, minlength=pairs * days).reshape(pairs, days).astype(np.float64)
+
+    future_weekdays = _weekdays(first_day + days + np.arange(horizon))
+    forecasts = {}
+    for name, daily in (("bookings", booked), ("revenue", revenue)):
+        factors, level = _seasonal_level(daily, first_day, method, alpha, window)
+        forecasts[name] = level[:, None] * factors[:, future_weekdays]
+
+    b_hour = b_times.astype("datetime64[h]").astype(np.int64) % 24
+    b_slot = _weekdays(b_times.astype("datetime64[D]").astype(np.int64)) * 24 + b_hour
+    profile = np.bincount(b_pair * HOURS_PER_WEEK + b_slot, minlength=pairs * HOURS_PER_WEEK).reshape(pairs, HOURS_PER_WEEK)
+    totals = profile.sum(axis=1, keepdims=True)
+    forecasts["hour_share"] = np.divide(profile, totals, out=np.zeros(profile.shape), where=totals > 0)
+
+    return keys >> 32, keys & 0xFFFFFFFF, forecasts
+
+
+def _data_version():
+    versions = dict(db.session.execute(versions_query(DEMAND_TABLES)).all())
+    return tuple(versions.get(name, 0) for name in DEMAND_TABLES)
+
+
+def _compute(today, history_days, horizon, method):
+    start = today - timedelta(days=history_days)
+    transactions, bookings = load_history(start, today)
+    if not (len(transactions[0]) or len(bookings[0])):
+        return []
+
+    staff_ids, service_ids, forecasts = forecast_arrays(
+        transactions, bookings, start, history_days, horizon, method, _alpha, _window,
+    )
+    dates = [(today + timedelta(days=offset)).date().isoformat() for offset in range(horizon)]
+    busiest = np.argsort(-forecasts["hour_share"], axis=1, kind="stable")[:, :3]
+    return [
+        {
+            "staff_id": int(staff_ids[i]),
+            "service_id": int(service_ids[i]),
+            "days": [
+                {"date": date, "bookings": round(float(booked), 2), "revenue": round(float(revenue), 2)}
+                for date, booked, revenue in zip(dates, forecasts["bookings"][i], forecasts["revenue"][i])
+            ],
+            "busiest_hours": [
+                {"weekday": int(slot) // 24, "hour": int(slot) % 24, "share": round(float(forecasts["hour_share"][i, slot]), 3)}
+                for slot in busiest[i] if forecasts["hour_share"][i, slot] > 0
+            ],
+        }
+        for i in range(len(staff_ids))
+    ]
+
+
+def demand_forecast(history_days, horizon, method="ema"):
+    """Forecasts for every staff/service pair in the request's branch, cached until new data lands."""
+    key = (current_branch_id(), history_days, horizon, method)
+    # The history window and the forecast dates both start from today
+    version = (datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0), _data_version())
+    cached = _cache.get(key)
+    cache_lookup("forecast", cached is not None and cached[0] == version)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    forecasts = _compute(version[0], history_days, horizon, method)
+    with _cache_lock:
+        _cache[key] = (version, forecasts)
+    return forecasts
+
+
+def invalidate_forecasts():
+    with _cache_lock:
+        _cache.clear()
+
+
+@event.listens_for(db.session, "before_flush")
+def _note_demand_changes(session, flush_context, instances):
+    # Spares this worker a round of stale reads; other workers go by _data_version()
+    if any(isinstance(obj, (Booking, Transaction)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["demand_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _drop_stale_forecasts(session):
+    if session.info.pop("demand_changed", False):
+        invalidate_forecasts()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_demand_changes(session):
+    session.info.pop("demand_changed", None)
+
+
+class ForecastResource(Resource):
+    @role_required("admin")
+    def get(self):
+        """Daily bookings and revenue forecast per staff/service pair: ?days=, ?history_days=, ?method=ema|moving_average."""
+        try:
+            horizon = int(request.args.get("days", 14))
+            history_days = int(request.args.get("history_days", 365))
+        except ValueError:
+            return {"error": "days and history_days must be integers"}, 400
+        if not (1 <= horizon <= 90 and 7 <= history_days <= 3650):
+            return {"error": "days must be 1-90 and history_days 7-3650"}, 400
+        method = request.args.get("method", "ema")
+        if method not in METHODS:
+            return {"error": f"method must be one of: {', '.join(METHODS)}"}, 400
+
+        return {"method": method, "history_days": history_days, "forecasts": demand_forecast(history_days, horizon, method)}, 200
+
+
+def init_app(app):
+    global _alpha, _window
+    _alpha = app.config["FORECAST_ALPHA"]
+    _window = app.config["FORECAST_WINDOW"]
+    invalidate_forecasts()
@@ -0,0 +1,44 @@
+# Used by render.yaml: `gunicorn -c gunicorn.conf.py wsgi:app`
+import glob
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+
+# Threaded workers: each runs at most ADMISSION_CAPACITY requests at once and
+# its other threads queue by priority (see admission.py), so logins and
+# bookings overtake a burst of reports instead of waiting behind it.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Build the app once in the master; workers fork with it already imported,
+# so start-up is paid once and unmodified pages are shared copy-on-write.
+preload_app = True
+
+# Workers write their metrics here and /metrics adds them up (see metrics.py).
+# Set before the app is preloaded, since prometheus_client reads it on import.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/beauty-shop-metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # Counters from a previous run would otherwise be added to this one's
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared between workers
+    from extensions import db
+    from replicas import dispose_replicas
+
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+        dispose_replicas(close=False)
+
+
+def child_exit(server, worker):
+    # Keep the dead worker's counters but drop its live gauges
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,318 @@
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask import request
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from flask_restful import Resource
+from sqlalchemy import and_, delete, event, func, insert, or_, select, union_all, update
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import (
+    Booking, BookingArchive, Review, Service, Staff, Transaction, TransactionArchive,
+    User, UserAffinity, UserStats,
+)
+from utils import upsert_increment
+
+FAVORITE_COLUMNS = {"staff": UserStats.favorite_staff_id, "service": UserStats.favorite_service_id}
+
+# kind -> (tables, owner column, columns returned per row)
+HISTORY_KINDS = {
+    "bookings": ((Booking, BookingArchive), "user_id", ("id", "service_id", "staff_id", "booking_time", "status")),
+    "transactions": ((Transaction, TransactionArchive), "client_id",
+                     ("id", "service_id", "staff_id", "amount_paid", "time_taken", "booking_time")),
+    "reviews": ((Review,), "client_id", ("id", "staff_id", "rating", "review")),
+}
+
+MAX_PER_PAGE = 50
+
+NEVER = datetime.min  # Last visit of affinities recorded before visits were dated
+
+
+def _favorite_rank(visits, last_visit_at, ref_id):
+    """The favorite is the highest rank: most visits, then the most recent visit, then the lowest id."""
+    return visits, last_visit_at or NEVER, -ref_id
+
+
+def _promote_favorite(connection, user_id, kind, ref_id):
+    """Make `ref_id`, which just had a visit, the favorite if it now outranks the current one (see `_favorite_rank`)."""
+    column = FAVORITE_COLUMNS[kind]
+
+    def affinity(ref, field):
+        return (
+            select(field)
+            .where(UserAffinity.user_id == user_id, UserAffinity.kind == kind, UserAffinity.ref_id == ref)
+            .scalar_subquery()
+        )
+
+    def visits(ref):
+        return affinity(ref, UserAffinity.visits)
+
+    def last_visit(ref):
+        return func.coalesce(affinity(ref, UserAffinity.last_visit_at), NEVER)
+
+    connection.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id, or_(
+            column.is_(None),
+            visits(column) < visits(ref_id),
+            and_(visits(column) == visits(ref_id), or_(
+                last_visit(column) < last_visit(ref_id),
+                and_(last_visit(column) == last_visit(ref_id), column > ref_id),
+            )),
+        ))
+        .values({column: ref_id})
+    )
+
+
+@event.listens_for(db.session, "before_flush", insert=True)
+def _note_deletions(session, flush_context, instances):
+    """
+    Note whose stats the deleted rows count in, to recompute after the flush:
+    a deletion can take away a favorite or a last visit, so decrementing won't
+    do. A staff member or service is also cleared as anyone's favorite, so its
+    row can go. Runs ahead of the archive hooks (archive.py, sweeper.py),
+    while archived rows still point at it.
+    """
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Booking, Transaction, Review, Staff, Service))]
+    if not deleted:
+        return
+
+    connection = session.connection()
+    users = session.info.setdefault("stale_user_stats", set())
+    for obj in deleted:
+        if isinstance(obj, Booking):
+            users.add(obj.user_id)
+            continue
+        if isinstance(obj, (Transaction, Review)):
+            if obj.client_id is not None:
+                users.add(obj.client_id)
+            continue
+        kind, column = ("staff", "staff_id") if isinstance(obj, Staff) else ("service", "service_id")
+        favorite = FAVORITE_COLUMNS[kind]
+        connection.execute(update(UserStats).where(favorite == obj.id).values({favorite: None}))
+        users.update(connection.execute(
+            select(UserAffinity.user_id).where(UserAffinity.kind == kind, UserAffinity.ref_id == obj.id)
+        ).scalars())
+        users.update(connection.execute(
+            select(BookingArchive.user_id).where(getattr(BookingArchive, column) == obj.id)
+        ).scalars())
+
+
+@event.listens_for(db.session, "after_flush")
+def _update_user_stats(session, flush_context):
+    """Fold new bookings, transactions and reviews into `user_stats`, inside the same transaction."""
+    new = [obj for obj in session.new if isinstance(obj, (Booking, Transaction, Review))]
+    stale = session.info.pop("stale_user_stats", set())
+    stale -= {obj.id for obj in session.deleted if isinstance(obj, User)}  # Their stats rows go with them
+    if not (new or stale):
+        return
+
+    connection = session.connection()
+    stats = UserStats.__table__
+    for obj in new:
+        if isinstance(obj, Booking):
+            upsert_increment(connection, stats, {"user_id": obj.user_id}, {"booking_count": 1})
+        elif isinstance(obj, Review) and obj.client_id is not None:
+            upsert_increment(connection, stats, {"user_id": obj.client_id}, {"review_count": 1})
+        elif isinstance(obj, Transaction) and obj.client_id is not None:
+            upsert_increment(connection, stats, {"user_id": obj.client_id},
+                  {"transaction_count": 1, "lifetime_spend": obj.amount_paid},
+                  latest={"last_visit_at": obj.booking_time})
+            for kind, ref_id in (("staff", obj.staff_id), ("service", obj.service_id)):
+                upsert_increment(connection, UserAffinity.__table__,
+                      {"user_id": obj.client_id, "kind": kind, "ref_id": ref_id}, {"visits": 1},
+                      latest={"last_visit_at": obj.booking_time})
+                _promote_favorite(connection, obj.client_id, kind, ref_id)
+    if stale:
+        _recompute_user_stats(connection, stale)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_deletions(session):
+    session.info.pop("stale_user_stats", None)
+
+
+def _recompute_user_stats(connection, user_ids=None):
+    """
+    Replace the `user_stats`/`user_affinities` rows of `user_ids` (default:
+    everyone) with totals from bookings, transactions and reviews, archives
+    included. Returns how many users have stats.
+    """
+    def scoped(query, column):
+        return query if user_ids is None else query.where(column.in_(user_ids))
+
+    connection.execute(scoped(delete(UserAffinity), UserAffinity.user_id))
+    connection.execute(scoped(delete(UserStats), UserStats.user_id))
+
+    stats = defaultdict(lambda: {"booking_count": 0, "transaction_count": 0, "review_count": 0,
+                                 "lifetime_spend": 0.0, "last_visit_at": None})
+    visits = defaultdict(int)
+    last_visits = {}
+
+    bookings = union_all(*(scoped(select(model.user_id), model.user_id) for model in (Booking, BookingArchive))).subquery()
+    for user_id, count in connection.execute(select(bookings.c.user_id, func.count()).group_by(bookings.c.user_id)):
+        stats[user_id]["booking_count"] = count
+
+    for user_id, count in connection.execute(
+        scoped(select(Review.client_id, func.count()).where(Review.client_id.isnot(None)), Review.client_id)
+        .group_by(Review.client_id)
+    ):
+        stats[user_id]["review_count"] = count
+
+    transactions = union_all(*(
+        scoped(select(model.client_id, model.staff_id, model.service_id, model.amount_paid, model.booking_time)
+               .where(model.client_id.isnot(None)), model.client_id)
+        for model in (Transaction, TransactionArchive)
+    )).subquery()
+    rows = connection.execute(
+        select(transactions.c.client_id, transactions.c.staff_id, transactions.c.service_id,
+               func.count(), func.sum(transactions.c.amount_paid), func.max(transactions.c.booking_time))
+        .group_by(transactions.c.client_id, transactions.c.staff_id, transactions.c.service_id)
+    )
+    for user_id, staff_id, service_id, count, spend, last_visit in rows:
+        row = stats[user_id]
+        row["transaction_count"] += count
+        row["lifetime_spend"] += spend or 0.0
+        if last_visit is not None and (row["last_visit_at"] is None or last_visit > row["last_visit_at"]):
+            row["last_visit_at"] = last_visit
+        for key in ((user_id, "staff", staff_id), (user_id, "service", service_id)):
+            visits[key] += count
+            if last_visit is not None and (last_visits.get(key) is None or last_visit > last_visits[key]):
+                last_visits[key] = last_visit
+
+    favorites = {}
+    for (user_id, kind, ref_id), count in visits.items():
+        rank = _favorite_rank(count, last_visits.get((user_id, kind, ref_id)), ref_id)
+        best = favorites.get((user_id, kind))
+        if best is None or rank > best[1]:
+            favorites[(user_id, kind)] = (ref_id, rank)
+
+    if stats:
+        connection.execute(insert(UserStats), [
+            {"user_id": user_id, **row,
+             "favorite_staff_id": favorites.get((user_id, "staff"), (None,))[0],
+             "favorite_service_id": favorites.get((user_id, "service"), (None,))[0]}
+            for user_id, row in stats.items()
+        ])
+    if visits:
+        connection.execute(insert(UserAffinity), [
+            {"user_id": user_id, "kind": kind, "ref_id": ref_id, "visits": count,
+             "last_visit_at": last_visits.get((user_id, kind, ref_id))}
+            for (user_id, kind, ref_id), count in visits.items()
+        ])
+    return len(stats)
+
+
+def rebuild_user_stats():
+    """Recompute every `user_stats`/`user_affinities` row from bookings, transactions and reviews, archives included."""
+    count = _recompute_user_stats(db.session.connection())
+    db.session.commit()
+    return count
+
+
+def history_page(kind, user_id, before=None, limit=20):
+    """
+    One page of a customer's history, newest first, as `(rows, next_before)`.
+    Keyset pagination on (owner, id) so deep pages cost the same as the first.
+    """
+    models, owner, columns = HISTORY_KINDS[kind]
+    branches = []
+    for model in models:
+        query = select(*(getattr(model, column) for column in columns)).where(getattr(model, owner) == user_id)
+        if before is not None:
+            query = query.where(model.id < before)
+        branches.append(select(query.order_by(model.id.desc()).limit(limit + 1).subquery()))
+    rows = (union_all(*branches) if len(branches) > 1 else branches[0]).subquery()
+
+    query = select(rows, Staff.name.label("staff")).outerjoin(Staff, Staff.id == rows.c.staff_id)
+    if "service_id" in columns:
+        query = query.add_columns(Service.name.label("service")).outerjoin(Service, Service.id == rows.c.service_id)
+    results = db.session.execute(query.order_by(rows.c.id.desc()).limit(limit + 1)).mappings().all()
+
+    next_before = results[limit - 1]["id"] if len(results) > limit else None
+    return [dict(row) for row in results[:limit]], next_before
+
+
+def _forbidden(user_id):
+    if get_jwt_identity() != str(user_id) and get_jwt().get("role") != "admin":
+        return {"error": "You can only view your own history"}, 403
+    return None
+
+
+def _serialize(row):
+    row.pop("service_id", None)
+    row.pop("staff_id", None)
+    if row.get("booking_time") is not None:
+        row["booking_time"] = row["booking_time"].isoformat()
+    return row
+
+
+class UserHistoryResource(Resource):
+    @jwt_required()
+    def get(self, user_id):
+        """Profile and lifetime summary for one customer, from their `user_stats` row."""
+        forbidden = _forbidden(user_id)
+        if forbidden:
+            return forbidden
+
+        FavoriteStaff, FavoriteService = aliased(Staff), aliased(Service)
+        row = db.session.execute(
+            select(User.id, User.name, User.username, User.email, User.picture, UserStats,
+                   FavoriteStaff.name, FavoriteService.name)
+            .outerjoin(UserStats, UserStats.user_id == User.id)
+            .outerjoin(FavoriteStaff, FavoriteStaff.id == UserStats.favorite_staff_id)
+            .outerjoin(FavoriteService, FavoriteService.id == UserStats.favorite_service_id)
+            .where(User.id == user_id)
+        ).first()
+        if row is None:
+            return {"error": "User not found"}, 404
+
+        user_id, name, username, email, picture, stats, staff_name, service_name = row
+        return {
+            "user": {"id": user_id, "name": name, "username": username, "email": email, "picture": picture},
+            "stats": {
+                "bookings": stats.booking_count if stats else 0,
+                "transactions": stats.transaction_count if stats else 0,
+                "reviews": stats.review_count if stats else 0,
+                "lifetime_spend": stats.lifetime_spend if stats else 0.0,
+                "last_visit_at": stats.last_visit_at.isoformat() if stats and stats.last_visit_at else None,
+                "favorite_staff": {"id": stats.favorite_staff_id, "name": staff_name}
+                if stats and stats.favorite_staff_id else None,
+                "favorite_service": {"id": stats.favorite_service_id, "name": service_name}
+                if stats and stats.favorite_service_id else None,
+            },
+        }
+
+
+class UserHistoryListResource(Resource):
+    @jwt_required()
+    def get(self, user_id, kind="bookings"):
+        """A customer's bookings, transactions or reviews, newest first: ?before=<id>&limit=20"""
+        if kind not in HISTORY_KINDS:
+            return {"error": f"Invalid history type. Choose from: {', '.join(HISTORY_KINDS)}"}, 400
+        forbidden = _forbidden(user_id)
+        if forbidden:
+            return forbidden
+
+        try:
+            before = int(request.args["before"]) if request.args.get("before") else None
+            limit = min(max(int(request.args.get("limit", 20)), 1), MAX_PER_PAGE)
+        except ValueError:
+            return {"error": "before and limit must be integers"}, 400
+
+        rows, next_before = history_page(kind, user_id, before, limit)
+        return {"items": [_serialize(row) for row in rows], "next_before": next_before}
+
+
+@click.command("rebuild-user-stats")
+@with_appcontext
+def rebuild_user_stats_command():
+    """Recompute the per-customer history summaries from scratch."""
+    click.echo(f"Rebuilt stats for {rebuild_user_stats()} users")
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_user_stats_command)
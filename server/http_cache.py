@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import Response, current_app, request
+from sqlalchemy import event, select
+
+from branches import BRANCH_HEADER, current_branch_id
+from extensions import db
+from metrics import cache_lookup
+from models import TableVersion
+from utils import upsert_increment
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/")
+
+# Tables some conditional endpoint depends on; writes to anything else don't bump a counter
+_tracked = set()
+
+
+def _table_name(table):
+    return getattr(table, "__tablename__", table)
+
+
+def _bump_versions(connection, names):
+    for name in sorted(names):  # Same order in every writer, so row locks can't deadlock
+        upsert_increment(connection, TableVersion.__table__, {"name": name}, {"version": 1})
+
+
+@event.listens_for(db.session, "after_flush")
+def _track_flush(session, flush_context):
+    """Bump the counters of tracked tables written by this flush, in the same transaction."""
+    changed = list(session.new) + list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]
+    names = {obj.__tablename__ for obj in changed if getattr(obj, "__tablename__", None) in _tracked}
+    if names:
+        _bump_versions(session.connection(), names)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    """Same for bulk INSERT/UPDATE/DELETE statements run through the session (sweeper, archiver...)."""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        name = orm_execute_state.statement.table.name
+        if name in _tracked:
+            _bump_versions(orm_execute_state.session.connection(), {name})
+
+
+def table_names(*tables):
+    """The sorted table names of models or tables, as `conditional` and `etag_for` take them."""
+    return tuple(sorted({_table_name(table) for table in tables}))
+
+
+def versions_query(tables):
+    return select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(tables))
+
+
+def etag_for(full_path, branch_id, tables, versions):
+    """Weak ETag for a URL (path and query, as `request.full_path`) and branch given the write counters of `tables`."""
+    state = ",".join(f"{name}:{versions.get(name, 0)}" for name in tables)
+    return hashlib.sha1(f"{full_path}|{branch_id}|{state}".encode()).hexdigest()[:20]
+
+
+def current_etag(tables):
+    """Weak ETag for this request; one primary-key lookup, no body hashing."""
+    versions = dict(db.session.execute(versions_query(tables)).all())
+    return etag_for(request.full_path, current_branch_id(), tables, versions)
+
+
+def track(names):
+    """Keep write counters for these tables."""
+    _tracked.update(names)
+
+
+def conditional(*tables):
+    """
+    Give a GET a weak ETag derived from the tables its response is built from,
+    and answer a matching If-None-Match with 304 before the handler runs. Place
+    it below `@jwt_required()` so the 304 is only given to authorized callers.
+    """
+    names = table_names(*tables)
+    track(names)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tag = current_etag(names)
+            revalidated = request.if_none_match.contains_weak(tag)
+            cache_lookup("etag", revalidated)
+            if revalidated:
+                response = Response(status=304)
+                response.set_etag(tag, weak=True)
+                response.headers["Cache-Control"] = "no-cache"
+                response.vary.add(BRANCH_HEADER)
+                return response
+
+            result = fn(*args, **kwargs)
+            if isinstance(result, Response):
+                if result.status_code == 200:
+                    result.set_etag(tag, weak=True)
+                    result.headers["Cache-Control"] = "no-cache"
+                    result.vary.add(BRANCH_HEADER)
+                return result
+
+            if not isinstance(result, tuple):
+                result = (result,)
+            data = result[0]
+            status = result[1] if len(result) > 1 else 200
+            headers = dict(result[2]) if len(result) > 2 else {}
+            if status == 200:
+                headers["ETag"] = f'W/"{tag}"'
+                headers["Cache-Control"] = "no-cache"  # Cache, but revalidate every time
+                headers["Vary"] = BRANCH_HEADER  # The same URL lists another branch's rows under another header
+            return data, status, headers
+
+        wrapper.etag_tables = names  # For asgi.py, which answers some of these GETs itself
+        return wrapper
+    return decorator
+
+
+def compress_response(response):
+    """gzip (or brotli, when installed and accepted) text responses above COMPRESSION_MIN_SIZE."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESSION_MIN_SIZE"]:
+        return response
+
+    response.set_data(compress(data, encoding, current_app.config["COMPRESSION_LEVEL"]))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def choose_encoding(accepted):
+    """The encoding to use given a parsed Accept-Encoding, or None to send the body as-is."""
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+from scheduler import scheduler
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def _identity():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity() or "anonymous"
+    except (JWTExtendedException, PyJWTError):
+        return "anonymous"
+
+
+def _claim(key, request_hash):
+    """
+    Insert the pending row for `key`. Returns None when this request now owns
+    the key, otherwise the row some earlier request left behind.
+    """
+    now = datetime.utcnow()
+    db.session.add(IdempotencyKey(
+        key=key, request_hash=request_hash, expires_at=now + current_app.config["IDEMPOTENCY_TTL"],
+    ))
+    try:
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = db.session.get(IdempotencyKey, key, populate_existing=True)
+    abandoned = existing is not None and existing.status_code is None \
+        and existing.created_at < now - current_app.config["IDEMPOTENCY_LOCK_TIMEOUT"]
+    if existing is None or existing.expires_at < now or abandoned:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        db.session.commit()
+        return _claim(key, request_hash)
+    return existing
+
+
+def _wait_for_result(record):
+    """Block a concurrent duplicate until the first request stores its response."""
+    deadline = time.monotonic() + current_app.config["IDEMPOTENCY_WAIT"]
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+        db.session.rollback()  # End the read transaction so the next get sees new commits
+        record = db.session.get(IdempotencyKey, record.key, populate_existing=True)
+    return record
+
+
+def _response_parts(result):
+    if isinstance(result, Response):
+        return result.status_code, result.get_data(as_text=True)
+    if isinstance(result, tuple):
+        return result[1], json.dumps(result[0])
+    return 200, json.dumps(result)
+
+
+def idempotent(fn):
+    """
+    Replay the stored response when a POST is retried with the same
+    Idempotency-Key, without running the handler again. Place it below
+    `@jwt_required()` so keys are scoped to the caller.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not client_key:
+            return fn(*args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return {"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"}, 400
+
+        key = hashlib.sha256(f"{_identity()}:{request.method}:{request.path}:{client_key}".encode()).hexdigest()
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        record = _claim(key, request_hash)
+        if record is not None:
+            if record.request_hash != request_hash:
+                return {"error": f"{IDEMPOTENCY_HEADER} was already used with a different request"}, 422
+            record = _wait_for_result(record)
+            if record is None or record.status_code is None:
+                return {"error": "A request with this Idempotency-Key is still in progress"}, 409, {"Retry-After": "1"}
+            return Response(record.response_body, status=record.status_code, mimetype="application/json",
+                            headers={REPLAY_HEADER: "true"})
+
+        # The handler's commits only flush: its work and the stored response are
+        # committed together below, so a crash in between can't leave one without the other
+        db.session.info["hold_commits"] = True
+        try:
+            result = fn(*args, **kwargs)
+            status_code, body = _response_parts(result)
+            if status_code >= 500:
+                # Don't pin a server error to the key; let the client retry for real
+                db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            else:
+                record = db.session.get(IdempotencyKey, key)
+                if record is not None:
+                    record.status_code = status_code
+                    record.response_body = body
+            db.session.info.pop("hold_commits")
+            db.session.commit()
+        except Exception:
+            db.session.info.pop("hold_commits", None)
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            db.session.commit()
+            raise
+        return result
+
+    return wrapper
+
+
+def prune_idempotency_keys(now=None):
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < (now or datetime.utcnow()))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    scheduler.add_job("idempotency_prune", prune_idempotency_keys, app.config["IDEMPOTENCY_PRUNE_INTERVAL"])
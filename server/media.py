@@ -0,0 +1,308 @@
+"""
+Picture uploads.
+
+An upload is stored once under its SHA-256 (MEDIA_DIR/ab/abcd....jpg), so the
+same picture uploaded again, by anyone, is the same file and the same URL.
+Its thumbnails (WebP, one per MEDIA_THUMBNAIL_SIZES bounding box) are made in
+a process pool after the response has gone, so neither the decode nor the
+resize holds a request thread or the GIL.
+
+    /media/<sha256>.<ext>          the original
+    /media/<sha256>.<ext>/<size>   a thumbnail, e.g. /media/ab...cd.jpg/160
+
+Both are immutable, so they are served with a year-long `immutable`
+Cache-Control, the hash as ETag, and Range support. A thumbnail that isn't
+ready yet is served as the original, cacheable for a minute only.
+
+The `media_files` row of a picture records its thumbnail job, so all workers
+see it: a job is queued only when none is in flight (or the one in flight
+was lost with a worker for MEDIA_THUMBNAIL_TIMEOUT), and after a failure
+only once its backoff has passed, at most MEDIA_THUMBNAIL_MAX_ATTEMPTS times.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from threading import Lock
+
+import click
+from flask import current_app, request, send_file, url_for
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import MediaFile
+
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+MEDIA_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|webp|gif)$")
+PLACEHOLDER_MAX_AGE = 60  # Seconds a thumbnail URL may cache the original while the thumbnail is made
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+_app = None  # For recording finished jobs, which complete outside any request
+_sizes = (160, 480)  # Set from config in init_app()
+_quality = 80
+_workers = 2
+
+
+def _path(name):
+    return os.path.join(current_app.config["MEDIA_DIR"], name[:2], name)
+
+
+def _thumbnail_name(digest, size):
+    return f"{digest}_{size}.webp"
+
+
+def _write_atomic(path, data):
+    """Write a file so that readers see all of it or none of it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def make_thumbnails(source, targets, quality):
+    """
+    Write a WebP thumbnail of `source` for each (bounding box, path) in
+    `targets`. Runs in the pool, so it takes paths rather than the app.
+    """
+    with Image.open(source) as image:
+        largest = max(size for size, _ in targets)
+        image.draft("RGB", (largest, largest))  # JPEG: decode at the smallest scale still big enough
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        # Largest first, each from the one before: less to resample every step
+        for size, path in sorted(targets, reverse=True):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            image.save(buffer, "WEBP", quality=quality, method=4)
+            _write_atomic(path, buffer.getvalue())
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():  # A forked gunicorn worker needs its own
+        # spawn, not fork: forking a threaded worker can copy a lock some other thread holds
+        _pool = ProcessPoolExecutor(_workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _drop_broken_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None  # The next job starts a new one
+
+
+def _missing_thumbnails(digest, original):
+    directory = os.path.dirname(original)
+    targets = [(size, os.path.join(directory, _thumbnail_name(digest, size))) for size in _sizes]
+    return [(size, path) for size, path in targets if not os.path.exists(path)]
+
+
+def _claimable(now):
+    """Pictures whose thumbnail job may be queued now."""
+    timeout = timedelta(seconds=_app.config["MEDIA_THUMBNAIL_TIMEOUT"])
+    return or_(
+        MediaFile.thumbnail_status == "ready",  # A file is missing: deleted, or a size added since
+        and_(MediaFile.thumbnail_status == "failed", MediaFile.thumbnail_retry_at <= now),
+        and_(
+            MediaFile.thumbnail_status == "queued",
+            or_(MediaFile.thumbnail_queued_at.is_(None), MediaFile.thumbnail_queued_at < now - timeout),
+        ),
+    )
+
+
+def queue_thumbnails(media, original):
+    """Have the pool make the picture's missing thumbnails, unless a job is in flight or backing off."""
+    digest = media.digest
+    targets = _missing_thumbnails(digest, original)
+    if not targets:
+        return
+    now = datetime.utcnow()
+    if media.thumbnail_status == "failed" and (media.thumbnail_retry_at is None or media.thumbnail_retry_at > now):
+        return  # Saves the UPDATE below on every request for a picture that keeps failing
+    claimed = db.session.execute(
+        update(MediaFile)
+        .where(MediaFile.digest == digest, _claimable(now))
+        .values(thumbnail_status="queued", thumbnail_queued_at=now, thumbnail_attempts=MediaFile.thumbnail_attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+
+    with _pool_lock:
+        pool = _get_pool()
+        future = pool.submit(make_thumbnails, original, targets, _quality)
+    future.add_done_callback(lambda future: _record_thumbnails(digest, pool, future))
+
+
+def _record_thumbnails(digest, pool, future):
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _drop_broken_pool(pool)
+    with _app.app_context():
+        media = db.session.get(MediaFile, digest)
+        if error is None:
+            media.thumbnail_status, media.thumbnail_error, media.thumbnail_retry_at = "ready", None, None
+        else:
+            _app.logger.error("Thumbnails for %s failed: %s", digest, error)
+            delay = _app.config["MEDIA_THUMBNAIL_RETRY_DELAY"] * 2 ** (media.thumbnail_attempts - 1)
+            media.thumbnail_status = "failed"
+            media.thumbnail_error = (str(error) or type(error).__name__)[:255]
+            media.thumbnail_retry_at = datetime.utcnow() + timedelta(seconds=delay) \
+                if media.thumbnail_attempts < _app.config["MEDIA_THUMBNAIL_MAX_ATTEMPTS"] else None
+        db.session.commit()
+
+
+def register_media(name, width, height, size):
+    """The picture's `media_files` row, created if this is its first upload."""
+    digest = name.split(".")[0]
+    media = db.session.get(MediaFile, digest)
+    if media is not None:
+        return media
+    db.session.add(MediaFile(digest=digest, name=name, width=width, height=height, bytes=size))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Uploaded at the same moment in another request
+    return db.session.get(MediaFile, digest)
+
+
+def _media_for(name, path):
+    """The row for a stored picture, registering files stored before rows were kept."""
+    media = db.session.get(MediaFile, name.split(".")[0])
+    if media is None:
+        with Image.open(path) as image:
+            media = register_media(name, *image.size, os.path.getsize(path))
+    return media
+
+
+def store_upload(data):
+    """
+    Validate and store picture bytes. Returns (name, metadata, created), or
+    raises ValueError with a message for the client.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+            if width * height > current_app.config["MEDIA_MAX_PIXELS"]:
+                raise ValueError(f"Pictures can be at most {current_app.config['MEDIA_MAX_PIXELS']:,} pixels")
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError("Not a readable picture")
+    if image_format not in EXTENSIONS:
+        raise ValueError(f"Pictures must be {', '.join(EXTENSIONS)}")
+
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{digest}.{EXTENSIONS[image_format]}"
+    path = _path(name)
+    created = not os.path.exists(path)
+    if created:
+        _write_atomic(path, data)
+    queue_thumbnails(register_media(name, width, height, len(data)), path)
+    metadata = {
+        "sha256": digest,
+        "content_type": Image.MIME[image_format],
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+    }
+    return name, metadata, created
+
+
+def _send(path, etag, max_age):
+    response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+    response.cache_control.public = True
+    if max_age > PLACEHOLDER_MAX_AGE:
+        response.cache_control.immutable = True
+    return response
+
+
+class MediaUploadResource(Resource):
+    @jwt_required()
+    def post(self):
+        """Upload a picture, as the multipart field `file` or the raw body. Returns its URL and its thumbnails'."""
+        max_bytes = current_app.config["MEDIA_MAX_BYTES"]
+        if (request.content_length or 0) > max_bytes + 4096:  # Room for the multipart headers
+            return {"error": f"Pictures can be at most {max_bytes // 1024} KB"}, 413
+        upload = request.files.get("file")
+        data = upload.read(max_bytes + 1) if upload is not None else request.get_data()
+        if not data:
+            return {"error": "No picture uploaded"}, 400
+        if len(data) > max_bytes:
+            return {"error": f"Pictures can be at most {max_bytes // 1024} KB"}, 413
+
+        try:
+            name, metadata, created = store_upload(data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {
+            "url": url_for("api.mediaresource", name=name),
+            "thumbnails": {str(size): url_for("api.mediaresource", name=name, size=size) for size in _sizes},
+            **metadata,
+        }, 201 if created else 200
+
+
+class MediaResource(Resource):
+    def get(self, name, size=None):
+        """An uploaded picture, or with a size one of its thumbnails."""
+        match = MEDIA_NAME.match(name)
+        if match is None or not os.path.exists(_path(name)):
+            return {"error": "Picture not found"}, 404
+        digest, original = match[1], _path(name)
+        max_age = current_app.config["MEDIA_CACHE_MAX_AGE"]
+        if size is None:
+            return _send(original, digest, max_age)
+
+        if size not in _sizes:
+            return {"error": f"size must be one of: {', '.join(map(str, _sizes))}"}, 404
+        thumbnail = os.path.join(os.path.dirname(original), _thumbnail_name(digest, size))
+        if os.path.exists(thumbnail):
+            return _send(thumbnail, f"{digest}-{size}", max_age)
+        queue_thumbnails(_media_for(name, original), original)
+        return _send(original, digest, PLACEHOLDER_MAX_AGE)
+
+
+@click.command("make-thumbnails")
+@with_appcontext
+def make_thumbnails_command():
+    """Make missing thumbnails for every stored picture, e.g. after changing MEDIA_THUMBNAIL_SIZES."""
+    made = 0
+    for directory, _, files in os.walk(current_app.config["MEDIA_DIR"]):
+        for name in files:
+            match = MEDIA_NAME.match(name)
+            if match is None:
+                continue
+            original = os.path.join(directory, name)
+            targets = _missing_thumbnails(match[1], original)
+            if targets:
+                make_thumbnails(original, targets, _quality)
+                made += len(targets)
+            media = _media_for(name, original)
+            media.thumbnail_status, media.thumbnail_error, media.thumbnail_retry_at = "ready", None, None
+            db.session.commit()
+    click.echo(f"Made {made} thumbnails")
+
+
+def init_app(app):
+    global _app, _sizes, _quality, _workers
+    if not app.config.get("MEDIA_DIR"):
+        app.config["MEDIA_DIR"] = os.path.join(app.instance_path, "media")
+    _app = app
+    _sizes = tuple(sorted(app.config["MEDIA_THUMBNAIL_SIZES"]))
+    _quality = app.config["MEDIA_THUMBNAIL_QUALITY"]
+    _workers = app.config["MEDIA_THUMBNAIL_WORKERS"]
+    app.cli.add_command(make_thumbnails_command)
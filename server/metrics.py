@@ -0,0 +1,128 @@
+"""
+Prometheus metrics, served at /metrics.
+
+Under gunicorn every worker records into files in PROMETHEUS_MULTIPROC_DIR
+(set up by gunicorn.conf.py) and a scrape of any worker adds them all up, so
+counts and histograms cover the whole server rather than whichever worker
+answered. Without that variable metrics are kept in-process.
+
+Requests are labelled with the flask-restful Resource that served them, taken
+from the view function, so every `api.add_resource` route is covered without
+touching its handlers.
+"""
+import hmac
+import os
+import time
+
+from flask import Response, current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+
+from extensions import db
+from replicas import replica_engines
+
+REQUESTS = Counter("http_requests_total", "Requests served", ["resource", "method", "status"])
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time from the first before_request hook to the response", ["resource", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_EXCEPTIONS = Counter("http_request_exceptions_total", "Requests that raised instead of answering", ["resource", "method"])
+
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections handed out by the pool", ["pool"])
+POOL_CONNECTS = Counter("db_pool_connects_total", "New database connections opened", ["pool"])
+POOL_INVALIDATIONS = Counter("db_pool_invalidations_total", "Connections discarded after an error", ["pool"])
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently in use", ["pool"], multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond pool_size", ["pool"], multiprocess_mode="livesum")
+
+BCRYPT_SECONDS = Histogram(
+    "bcrypt_duration_seconds", "Time spent hashing or checking passwords", ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2),
+)
+
+CACHE_REQUESTS = Counter("cache_requests_total", "In-process cache lookups", ["cache", "result"])
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def resource_name():
+    """The flask-restful Resource serving this request (or the endpoint, for plain views)."""
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    if view is None:
+        return "unmatched"
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class is not None else request.endpoint
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        resource = resource_name()
+        REQUESTS.labels(resource, request.method, response.status_code).inc()
+        REQUEST_LATENCY.labels(resource, request.method).observe(time.perf_counter() - start)
+    return response
+
+
+def _record_exception(exc):
+    # Only requests that never reached _record (the exception propagated) are left with a start time
+    if exc is not None and g.pop("metrics_start", None) is not None:
+        resource = resource_name()
+        REQUESTS.labels(resource, request.method, 500).inc()
+        REQUEST_EXCEPTIONS.labels(resource, request.method).inc()
+
+
+def instrument_engine(engine, name):
+    """Count checkouts, new connections and overflow for one engine's pool."""
+    pool = engine.pool
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        POOL_CONNECTS.labels(name).inc()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.labels(name).inc()
+        POOL_CHECKED_OUT.labels(name).inc()
+        if hasattr(pool, "overflow"):
+            POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.labels(name).dec()
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        POOL_INVALIDATIONS.labels(name).inc()
+
+
+def metrics_view():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response(status=401)
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    # Registered before most modules' hooks (see create_app), so the timer covers them too
+    app.before_request(_start_timer)
+    app.after_request(_record)
+    app.teardown_request(_record_exception)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+    with app.app_context():
+        instrument_engine(db.engine, "primary")
+    for name, engine in replica_engines().items():
+        instrument_engine(engine, name)
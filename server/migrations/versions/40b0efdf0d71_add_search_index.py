@@ -0,0 +1,54 @@
+"""add search index
+
+Revision ID: 40b0efdf0d71
+Revises: 9934357fe8e1
+Create Date: 2026-10-19 13:10:02.114823
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '40b0efdf0d71'
+down_revision = '9934357fe8e1'
+branch_labels = None
+depends_on = None
+
+# Must match search.SEARCH_KINDS: rowid = ref_id * 4 + kind code
+SQLITE_BACKFILL = [
+    "INSERT INTO search_index (rowid, content) SELECT id * 4 + 0, name FROM services",
+    "INSERT INTO search_index (rowid, content) SELECT id * 4 + 1, name || ' ' || role FROM staff",
+    "INSERT INTO search_index (rowid, content) SELECT id * 4 + 2, name || ' ' || username || ' ' || email FROM users",
+    "INSERT INTO search_index (rowid, content) SELECT id * 4 + 3, coalesce(review, '') FROM reviews",
+]
+
+POSTGRES_TRIGRAM_INDEXES = {
+    'ix_services_name_trgm': ('services', 'name'),
+    'ix_staff_name_trgm': ('staff', 'name'),
+    'ix_users_name_trgm': ('users', 'name'),
+    'ix_users_username_trgm': ('users', 'username'),
+    'ix_users_email_trgm': ('users', 'email'),
+    'ix_reviews_review_trgm': ('reviews', 'review'),
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(content, tokenize='unicode61')")
+        for statement in SQLITE_BACKFILL:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, (table, column) in POSTGRES_TRIGRAM_INDEXES.items():
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS search_index")
+    elif dialect == 'postgresql':
+        for name in POSTGRES_TRIGRAM_INDEXES:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -2,14 +2,15 @@
 
 
 from sqlalchemy.ext.associationproxy import association_proxy
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import Enum, func
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy_serializer import SerializerMixin 
-from config import db, bcrypt
+from sqlalchemy.orm import declared_attr
+from extensions import db, bcrypt
+from metrics import BCRYPT_SECONDS
 
 # User Model
-class User(db.Model, SerializerMixin):
+class User(db.Model):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -25,7 +26,10 @@ class User(db.Model, SerializerMixin):
     reviews = db.relationship('Review', back_populates='client', cascade='all, delete-orphan')
     transactions = db.relationship('Transaction', back_populates='client', cascade='all, delete-orphan')
     bookings = db.relationship('Booking', back_populates='user', cascade='all, delete-orphan')
-
+    refresh_families = db.relationship('RefreshTokenFamily', cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', uselist=False, cascade='all, delete-orphan')
+    affinities = db.relationship('UserAffinity', cascade='all, delete-orphan')
+    waitlist_entries = db.relationship('WaitlistEntry', back_populates='user', cascade='all, delete-orphan')
 
     # Password hashing
     @hybrid_property
@@ -34,10 +38,12 @@ class User(db.Model, SerializerMixin):
 
     @password_hash.setter
     def password_hash(self, plaintext_password):
-        self._password_hash = bcrypt.generate_password_hash(plaintext_password).decode('utf-8')
+        with BCRYPT_SECONDS.labels("hash").time():
+            self._password_hash = bcrypt.generate_password_hash(plaintext_password).decode('utf-8')
 
     def check_password(self, plaintext_password):
-        return bcrypt.check_password_hash(self._password_hash, plaintext_password)
+        with BCRYPT_SECONDS.labels("check").time():
+            return bcrypt.check_password_hash(self._password_hash, plaintext_password)
 
     @classmethod
     def validate_uniqueness(cls, email, username):
@@ -49,6 +55,71 @@ class User(db.Model, SerializerMixin):
     def __repr__(self):
         return f"<User {self.name}>"
 
+# One row per login session; each refresh rotates `current_jti`
+class RefreshTokenFamily(db.Model):
+    __tablename__ = 'refresh_token_families'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    current_jti = db.Column(db.String(36), nullable=False)
+    revoked = db.Column(db.Boolean, nullable=False, default=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<RefreshTokenFamily {self.id} user_id={self.user_id}>"
+
+# Stored responses for POSTs sent with an Idempotency-Key header
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of user, endpoint and client key
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # NULL while the first request is still running
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} status={self.status_code}>"
+
+class TokenRevocation(db.Model):
+    """
+    A revoked token (kind "token", ref = its jti), or every token issued to a
+    user before `revoked_at` (kind "user", ref = user id); see session_cache.py.
+    """
+    __tablename__ = 'token_revocations'
+
+    kind = db.Column(db.String(10), primary_key=True)
+    ref = db.Column(db.String(64), primary_key=True)
+    revoked_at = db.Column(db.Integer, nullable=False)  # Unix time, whole seconds like `iat`
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # No token it covers is valid after this
+
+    def __repr__(self):
+        return f"<TokenRevocation {self.kind}={self.ref}>"
+
+# A shop location. Single-location installs only ever use branch 1.
+class Branch(db.Model):
+    __tablename__ = 'branches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    address = db.Column(db.String(255), nullable=True)
+
+    def __repr__(self):
+        return f"<Branch {self.name}>"
+
+
+class BranchScoped:
+    """
+    Rows that belong to one branch. While a request is scoped to a branch, ORM
+    queries only see that branch's rows (see branches.py). Rows inserted
+    without a branch land in branch 1.
+    """
+    @declared_attr
+    def branch_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('branches.id'), nullable=False, server_default='1')
+
+
 # Association table for Staff and Services
 class StaffService(db.Model):
     __tablename__ = 'staff_service'
@@ -64,10 +135,11 @@ class StaffService(db.Model):
 
 # Staff Model
 from sqlalchemy import Enum
-class Staff(db.Model, SerializerMixin):
+class Staff(BranchScoped, db.Model):
     __tablename__ = 'staff'
-
-    serialize_rules = ('-staff_services', '-services', '-reviews', '-transactions')
+    __table_args__ = (
+        db.Index('ix_staff_branch_id_id', 'branch_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
@@ -89,21 +161,7 @@ class Staff(db.Model, SerializerMixin):
     reviews = db.relationship('Review', back_populates='staff', cascade='all, delete-orphan')
     transactions = db.relationship('Transaction', back_populates='staff', cascade='all, delete-orphan')
     bookings = db.relationship('Booking', back_populates='staff', cascade='all, delete-orphan')
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "picture": self.picture,
-            "gender": self.gender.value if isinstance(self.gender, Enum) else self.gender if self.gender else "not specified",
-            "role": self.role.value if isinstance(self.role, Enum) else self.role if self.role else "not specified",
-            "services": [service.id for service in self.services],
-            "reviews": [review.id for review in self.reviews],
-            "transactions": [transaction.id for transaction in self.transactions],
-            "bookings": [booking.id for booking in self.bookings]
-        }
-
-
+    waitlist_entries = db.relationship('WaitlistEntry', back_populates='staff', cascade='all, delete-orphan')
 
     @hybrid_property
     def average_rating(self):
@@ -116,8 +174,11 @@ class Staff(db.Model, SerializerMixin):
         return f"<Staff {self.name}>"
 
 # Service Model
-class Service(db.Model, SerializerMixin):
+class Service(BranchScoped, db.Model):
     __tablename__ = 'services'
+    __table_args__ = (
+        db.Index('ix_services_branch_id_id', 'branch_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
@@ -127,26 +188,40 @@ class Service(db.Model, SerializerMixin):
 
     # Relationships
     service_staff = db.relationship('StaffService', back_populates='service', cascade='all, delete-orphan')
+    prices = db.relationship('ServicePrice', back_populates='service', cascade='all, delete-orphan',
+                             order_by='ServicePrice.effective_from')
     staff = association_proxy('service_staff', 'staff')
     transactions = db.relationship('Transaction', back_populates='service', cascade='all, delete-orphan')
     bookings = db.relationship('Booking', back_populates='service', cascade='all, delete-orphan')
+    affinities = db.relationship('ServiceAffinity', cascade='all, delete-orphan')
+    waitlist_entries = db.relationship('WaitlistEntry', back_populates='service', cascade='all, delete-orphan')
 
+    def __repr__(self):
+        return f"<Service {self.name}>"
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "picture": self.picture,
-            "price": self.price,
-            "time_taken": self.time_taken
-        }
+# Every price a service has had; `Service.price` is the latest one
+class ServicePrice(db.Model):
+    __tablename__ = 'service_prices'
+    __table_args__ = (
+        db.Index('ix_service_prices_service_id_effective_from', 'service_id', 'effective_from'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    service = db.relationship('Service', back_populates='prices')
 
     def __repr__(self):
-        return f"<Service {self.name}>"
+        return f"<ServicePrice service_id={self.service_id} {self.price} from {self.effective_from}>"
 
 # Review Model
-class Review(db.Model, SerializerMixin):
+class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.Index('ix_reviews_client_id_id', 'client_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'))
@@ -162,8 +237,12 @@ class Review(db.Model, SerializerMixin):
         return f"<Review {self.rating} - {self.staff.name}>"
     
     
-class Transaction(db.Model, SerializerMixin):
+class Transaction(BranchScoped, db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_client_id_id', 'client_id', 'id'),
+        db.Index('ix_transactions_branch_id_booking_time', 'branch_id', 'booking_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
@@ -172,7 +251,7 @@ class Transaction(db.Model, SerializerMixin):
     client_name = db.Column(db.String, nullable=False)  # Required, even for unregistered clients
     amount_paid = db.Column(db.Float, nullable=False)
     time_taken = db.Column(db.Float, nullable=False)  # Hours
-    booking_time = db.Column(db.DateTime, default=datetime.utcnow)
+    booking_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
 
     # Relationships
@@ -182,26 +261,279 @@ class Transaction(db.Model, SerializerMixin):
 
     def __repr__(self):
         return f"<Transaction {self.service.name} by {self.staff.name}>"
+
+
+
+class TransactionArchive(BranchScoped, db.Model):
+    """Transactions older than TRANSACTION_HOT_DAYS, moved out of `transactions` by the archiver."""
+    __tablename__ = 'transactions_archive'
+    __table_args__ = (
+        db.Index('ix_transactions_archive_client_id_id', 'client_id', 'id'),
+        db.Index('ix_transactions_archive_branch_id_booking_time', 'branch_id', 'booking_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id the row had in `transactions`
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    client_name = db.Column(db.String, nullable=False)
+    amount_paid = db.Column(db.Float, nullable=False)
+    time_taken = db.Column(db.Float, nullable=False)
+    booking_time = db.Column(db.DateTime, index=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TransactionArchive {self.id}>"
+
+
+class TransactionRollup(BranchScoped, db.Model):
+    """Monthly per staff/service totals of archived transactions, so all-time reports skip the archive."""
+    __tablename__ = 'transaction_rollups'
+    __table_args__ = (
+        db.Index('ix_transaction_rollups_branch_id_month', 'branch_id', 'month'),
+    )
+
+    month = db.Column(db.Date, primary_key=True)  # First day of the month
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), primary_key=True)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<TransactionRollup {self.month} staff={self.staff_id} service={self.service_id}>"
     
 
 
 
 
 
-class Booking(db.Model, SerializerMixin):
+# Bookings in these states still hold their slot; anything else is closed
+BOOKING_ACTIVE_STATUSES = ("pending", "confirmed")
+
+
+class Booking(BranchScoped, db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_branch_id_booking_time', 'branch_id', 'booking_time'),
+        db.Index('ix_bookings_staff_id_booking_time', 'staff_id', 'booking_time'),
+        db.Index('ix_bookings_status_booking_time', 'status', 'booking_time'),
+        db.Index('ix_bookings_user_id_id', 'user_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
     booking_time = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default="pending")  # "pending", "confirmed", "completed", "canceled"
+    status = db.Column(db.String(20), default="pending")  # "pending", "confirmed", "completed", "canceled", "expired", "no_show"
 
     # Relationships
     service = db.relationship('Service', back_populates='bookings')
     user = db.relationship('User', back_populates='bookings')
     staff = db.relationship('Staff', back_populates='bookings')
 
+    @classmethod
+    def find_conflict(cls, intervals):
+        """
+        Given `(staff_id, start, end)` intervals, return the index of the first one
+        that overlaps another interval in the list or an active booking, else None.
+        Existing bookings come from one range query on (staff_id, booking_time);
+        services are assumed to last less than a day.
+        """
+        for index, (staff_id, start, end) in enumerate(intervals):
+            for other_staff_id, other_start, other_end in intervals[:index]:
+                if staff_id == other_staff_id and start < other_end and other_start < end:
+                    return index
+
+        existing = {}
+        rows = (
+            db.session.query(cls.staff_id, cls.booking_time, Service.time_taken)
+            .join(Service, Service.id == cls.service_id)
+            .filter(
+                cls.staff_id.in_({staff_id for staff_id, _, _ in intervals}),
+                cls.status.in_(BOOKING_ACTIVE_STATUSES),
+                cls.booking_time >= min(start for _, start, _ in intervals) - timedelta(days=1),
+                cls.booking_time < max(end for _, _, end in intervals),
+            )
+        )
+        for staff_id, booking_time, time_taken in rows:
+            existing.setdefault(staff_id, []).append((booking_time, booking_time + timedelta(hours=time_taken)))
+
+        for index, (staff_id, start, end) in enumerate(intervals):
+            if any(start < other_end and other_start < end for other_start, other_end in existing.get(staff_id, [])):
+                return index
+        return None
+
+    def __repr__(self):
+        return f"<Booking {self.service.name} by {self.user.name} with {self.staff.name}>"
+
+
+class WaitlistEntry(BranchScoped, db.Model):
+    """A customer waiting for a slot with a staff member (or anyone qualified) inside a time window; see waitlist.py."""
+    __tablename__ = 'waitlist_entries'
+    __table_args__ = (
+        db.Index('ix_waitlist_entries_staff_id_status_window_start', 'staff_id', 'status', 'window_start'),
+        db.Index('ix_waitlist_entries_service_id_status_window_start', 'service_id', 'status', 'window_start'),
+        db.Index('ix_waitlist_entries_user_id_id', 'user_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # Also the queue position: lower ids are offered first
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=True)  # None: any qualified staff member
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False)  # The service must finish by then
+    status = db.Column(db.String(20), nullable=False, default="waiting")  # "waiting", "booked", "withdrawn", "expired"
+    booking_id = db.Column(db.Integer, nullable=True)  # The booking made for it; not a foreign key, bookings get archived
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    user = db.relationship('User', back_populates='waitlist_entries')
+    service = db.relationship('Service', back_populates='waitlist_entries')
+    staff = db.relationship('Staff', back_populates='waitlist_entries')
+
+    def __repr__(self):
+        return f"<WaitlistEntry {self.id} user_id={self.user_id} service_id={self.service_id} {self.status}>"
+
+
+class BookingArchive(BranchScoped, db.Model):
+    """Closed bookings moved out of the hot `bookings` table by the sweeper."""
+    __tablename__ = 'bookings_archive'
+    __table_args__ = (
+        db.Index('ix_bookings_archive_branch_id_booking_time', 'branch_id', 'booking_time'),
+        db.Index('ix_bookings_archive_user_id_id', 'user_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id the row had in `bookings`
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    booking_time = db.Column(db.DateTime)
+    status = db.Column(db.String(20))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BookingArchive {self.id} {self.status}>"
+
+
+class UserStats(db.Model):
+    """Per-customer totals kept up to date on every write, so a profile never aggregates history."""
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    lifetime_spend = db.Column(db.Float, nullable=False, default=0.0)
+    last_visit_at = db.Column(db.DateTime, nullable=True)
+    favorite_staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=True)
+    favorite_service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=True)
+
+    def __repr__(self):
+        return f"<UserStats user_id={self.user_id} transactions={self.transaction_count}>"
+
+
+class UserAffinity(db.Model):
+    """Visits per customer and staff member/service; backs the favorites in `user_stats`."""
+    __tablename__ = 'user_affinities'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # "staff" or "service"
+    ref_id = db.Column(db.Integer, primary_key=True)
+    visits = db.Column(db.Integer, nullable=False, default=0)
+    last_visit_at = db.Column(db.DateTime, nullable=True)  # Breaks ties between favorites
+
+    def __repr__(self):
+        return f"<UserAffinity user_id={self.user_id} {self.kind}={self.ref_id} visits={self.visits}>"
+
+
+class ServiceAffinity(db.Model):
+    """
+    Sparse service x service and service x staff co-occurrence, one row per
+    non-zero cell: customers who had both services, or visits for the service
+    with that staff member. Rebuilt and kept up to date by recommendations.py.
+    """
+    __tablename__ = 'service_affinities'
+
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # "service" or "staff"
+    ref_id = db.Column(db.Integer, primary_key=True)
+    weight = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ServiceAffinity service_id={self.service_id} {self.kind}={self.ref_id} weight={self.weight}>"
+
+
+class TableVersion(db.Model):
+    """Write counter per table, bumped in the writing transaction; conditional GETs build ETags from it."""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TableVersion {self.name}={self.version}>"
+
+
+class AuditEvent(db.Model):
+    """Append-only record of a change to an audited table; written in batches by audit.py."""
+    __tablename__ = 'audit_events'
+    __table_args__ = (
+        db.Index('ix_audit_events_entity', 'entity', 'entity_id', 'id'),
+        db.Index('ix_audit_events_actor_id', 'actor_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)  # When the change was committed
+    actor_id = db.Column(db.Integer, nullable=True)  # JWT identity; NULL for unauthenticated requests and jobs
+    action = db.Column(db.String(10), nullable=False)  # "create", "update" or "delete"
+    entity = db.Column(db.String(64), nullable=False)  # Table name
+    entity_id = db.Column(db.String(64), nullable=False)  # Primary key, "a:b" for composite keys
+    changes = db.Column(db.Text, nullable=False)  # JSON: new values, {column: [old, new]} or the deleted row
+
+    def __repr__(self):
+        return f"<AuditEvent {self.action} {self.entity}:{self.entity_id}>"
+
+
+class Reminder(db.Model):
+    """
+    Delivery state of one appointment reminder, claimed before it is sent so
+    that a restart or a second worker never sends it twice; see reminders.py.
+    """
+    __tablename__ = 'reminders'
+    __table_args__ = (
+        db.Index('ix_reminders_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    booking_id = db.Column(db.Integer, primary_key=True)  # Not a foreign key, bookings get archived
+    lead_minutes = db.Column(db.Integer, primary_key=True)  # Sent this long before the booking
+    status = db.Column(db.String(10), nullable=False, default="sending")  # "sending", "sent", "failed"
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    claimed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Start of the latest attempt
+    sent_at = db.Column(db.DateTime, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)  # Set while a failed reminder will be retried
+    error = db.Column(db.String(255), nullable=True)
+
+    def __repr__(self):
+        return f"<Reminder booking_id={self.booking_id} lead_minutes={self.lead_minutes} {self.status}>"
+
+
+class MediaFile(db.Model):
+    """An uploaded picture and the state of its thumbnails; the files themselves live in MEDIA_DIR (see media.py)."""
+    __tablename__ = 'media_files'
+
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of the original
+    name = db.Column(db.String(80), nullable=False)  # <digest>.<ext>, the file name and URL
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    thumbnail_status = db.Column(db.String(10), nullable=False, default="queued")  # "queued", "ready", "failed"
+    thumbnail_attempts = db.Column(db.Integer, nullable=False, default=0)
+    thumbnail_queued_at = db.Column(db.DateTime, nullable=True)  # Start of the latest attempt
+    thumbnail_retry_at = db.Column(db.DateTime, nullable=True)  # Set while a failed job will be retried
+    thumbnail_error = db.Column(db.String(255), nullable=True)
+
     def __repr__(self):
-        return f"<Booking {self.service.name} by {self.user.name} with {self.staff.name}>"
\ No newline at end of file
+        return f"<MediaFile {self.name} thumbnails={self.thumbnail_status}>"
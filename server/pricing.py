@@ -0,0 +1,131 @@
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+from threading import Lock
+
+from flask import request
+from flask_restful import Resource
+from sqlalchemy import event, inspect, select
+
+from extensions import db
+from metrics import cache_lookup
+from models import Service, ServicePrice
+
+# Every service's price history, `{service_id: ([effective_from, ...], [price, ...])}`,
+# loaded with one query. Price tables are tiny, so holding all of it lets any
+# "price as of T" be a bisect. Dropped when a commit adds a price and reloaded
+# after PRICE_CACHE_TTL so other worker processes pick up changes too.
+_history = None   # (history, loaded at)
+_history_lock = Lock()
+_ttl = 60  # Set from config in init_app()
+
+
+def _load_history():
+    history = {}
+    rows = db.session.execute(
+        select(ServicePrice.service_id, ServicePrice.effective_from, ServicePrice.price)
+        .order_by(ServicePrice.service_id, ServicePrice.effective_from, ServicePrice.id)
+    )
+    for service_id, effective_from, price in rows:
+        times, prices = history.setdefault(service_id, ([], []))
+        times.append(effective_from)
+        prices.append(price)
+    return history, time.monotonic()
+
+
+def _get_history(reload=False):
+    global _history
+    cached = _history
+    stale = reload or cached is None or time.monotonic() - cached[1] > _ttl
+    if stale:
+        with _history_lock:
+            stale = reload or _history is None or time.monotonic() - _history[1] > _ttl
+            if stale:
+                _history = _load_history()
+            cached = _history
+    cache_lookup("prices", not stale)
+    return cached[0]
+
+
+def invalidate_prices():
+    global _history
+    with _history_lock:
+        _history = None
+
+
+def price_at(service_id, at=None, reload=False):
+    """The price of a service in effect at `at` (default: now), or None if it had none yet."""
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)  # History is naive UTC
+    history = _get_history(reload).get(int(service_id))
+    if history is None:
+        return None
+    times, prices = history
+    index = len(times) - 1 if at is None else bisect_right(times, at) - 1
+    return prices[index] if index >= 0 else None
+
+
+def price_at_query(service_id_column, at_column):
+    """Correlated scalar subquery for the price in effect at `at_column`, served by the (service_id, effective_from) index."""
+    return (
+        select(ServicePrice.price)
+        .where(ServicePrice.service_id == service_id_column, ServicePrice.effective_from <= at_column)
+        .order_by(ServicePrice.effective_from.desc(), ServicePrice.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+@event.listens_for(db.session, "before_flush")
+def _record_price_changes(session, flush_context, instances):
+    """Append a price row whenever a service is created or its price changes."""
+    now = datetime.utcnow()
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Service):
+            continue
+        if obj in session.new or inspect(obj).attrs.price.history.has_changes():
+            # Set from the ServicePrice side so the unloaded `prices` collection isn't fetched
+            session.add(ServicePrice(service=obj, price=obj.price, effective_from=now))
+            session.info["prices_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _drop_stale_prices(session):
+    if session.info.pop("prices_changed", False):
+        invalidate_prices()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_price_changes(session):
+    session.info.pop("prices_changed", None)
+
+
+class ServicePriceResource(Resource):
+    def get(self, service_id):
+        """Price history of a service, or the price in effect at ?at=<ISO datetime>."""
+        at = request.args.get("at")
+        if at:
+            try:
+                at = datetime.fromisoformat(at)
+            except ValueError:
+                return {"error": "Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+            if at.tzinfo is not None:
+                at = at.astimezone(timezone.utc).replace(tzinfo=None)
+            price = price_at(service_id, at)
+            if price is None:
+                return {"error": "No price in effect for this service at that time"}, 404
+            return {"service_id": service_id, "at": at.isoformat(), "price": price}, 200
+
+        history = _get_history().get(service_id)
+        if history is None:
+            return {"error": "Service not found"}, 404
+        return [
+            {"effective_from": effective_from.isoformat(), "price": price}
+            for effective_from, price in zip(*history)
+        ], 200
+
+
+def init_app(app):
+    global _ttl
+    _ttl = app.config["PRICE_CACHE_TTL"]
+    invalidate_prices()
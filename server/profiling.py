@@ -0,0 +1,270 @@
+"""
+On-demand request profiling.
+
+An admin sends `X-Profile: 1`, or PROFILE_SAMPLE_RATE picks a request at
+random, and that request is profiled: a background thread samples its stack
+every PROFILE_INTERVAL_MS (wall clock, so time spent waiting on the database
+shows up too) and every SQL statement it runs is timed. The result is written
+to PROFILE_DIR as
+
+    <id>.collapsed         one `frame;frame;frame count` line per stack, for flamegraph.pl / speedscope
+    <id>.speedscope.json   speedscope's own format, samples in time order
+    <id>.json              request, status, duration and the SQL statements with their timings
+
+and listed at /admin/profiles. Only the newest PROFILE_KEEP profiles are kept.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from uuid import uuid4
+
+from flask import current_app, g, has_request_context, request, send_from_directory
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_restful import Resource
+from jwt.exceptions import PyJWTError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils import role_required
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID = re.compile(r"^[0-9T]{15}-[0-9a-f]{8}$")
+FORMATS = {"collapsed": ".collapsed", "speedscope": ".speedscope.json", "json": ".json"}
+SKIPPED_ENDPOINTS = ("metrics", "api.profilelistresource", "api.profileresource")
+MAX_SQL_LENGTH = 2000
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(_SERVER_DIR):
+        filename = filename[len(_SERVER_DIR):]
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """Records the stack of one thread every `interval` seconds until stopped."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []  # Stacks, root first, in the order they were taken
+        self._names = {}   # code object -> frame name, so each is formatted once
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = self._names.get(code)
+                if name is None:
+                    name = self._names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples.append(tuple(stack))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, interval):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid4().hex[:8]}"
+        self.created_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.sql = []
+        self.sampler = Sampler(threading.get_ident(), interval)
+        self.sampler.start()
+
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in Counter(self.sampler.samples).items())
+
+    def speedscope(self, name, duration_ms):
+        frames, index = [], {}
+        samples = []
+        for stack in self.sampler.samples:
+            indices = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indices.append(index[frame])
+            samples.append(indices)
+        interval_ms = self.sampler.interval * 1000
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "beauty-shop profiling.py",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": duration_ms,
+                "samples": samples,
+                "weights": [interval_ms] * len(samples),
+            }],
+        }
+
+
+def _wants_profile():
+    if request.endpoint in SKIPPED_ENDPOINTS:
+        return False
+    if request.headers.get(PROFILE_HEADER):
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt().get("role") == "admin"
+        except (JWTExtendedException, PyJWTError):
+            return False
+    rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if _wants_profile():
+        g.profile = Profile(current_app.config["PROFILE_INTERVAL_MS"] / 1000)
+
+
+def _finish_profile(status):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return None
+    profile.sampler.stop()
+    duration_ms = (time.perf_counter() - profile.started) * 1000
+    name = f"{request.method} {request.full_path.rstrip('?')}"
+    summary = {
+        "id": profile.id,
+        "created_at": profile.created_at.isoformat(),
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "status": status,
+        "duration_ms": round(duration_ms, 2),
+        "samples": len(profile.sampler.samples),
+        "interval_ms": profile.sampler.interval * 1000,
+        "sql_count": len(profile.sql),
+        "sql_ms": round(sum(ms for _, ms in profile.sql), 2),
+        "sql": [{"statement": statement, "ms": round(ms, 3)} for statement, ms in profile.sql],
+    }
+
+    directory = current_app.config["PROFILE_DIR"]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, profile.id)
+        with open(path + FORMATS["collapsed"], "w") as f:
+            f.write(profile.collapsed())
+        with open(path + FORMATS["speedscope"], "w") as f:
+            json.dump(profile.speedscope(name, duration_ms), f)
+        with open(path + FORMATS["json"], "w") as f:
+            json.dump(summary, f)
+        _prune(directory, current_app.config["PROFILE_KEEP"])
+    except OSError:
+        current_app.logger.exception("Could not write profile %s", profile.id)
+        return None
+    return profile.id
+
+
+def _prune(directory, keep):
+    ids = sorted(name[:-len(".json")] for name in os.listdir(directory)
+                 if name.endswith(".json") and not name.endswith(".speedscope.json"))
+    for profile_id in ids[:-keep]:
+        for suffix in FORMATS.values():
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _after_request(response):
+    profile_id = _finish_profile(response.status_code)
+    if profile_id is not None:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _teardown(exc):
+    # Requests whose exception escaped never reached _after_request
+    if exc is not None:
+        _finish_profile(500)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get("profile") is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("profile_started")
+    if started and has_request_context() and g.get("profile") is not None:
+        g.profile.sql.append((statement[:MAX_SQL_LENGTH], (time.perf_counter() - started.pop()) * 1000))
+
+
+def recent_profiles(limit=50):
+    directory = current_app.config["PROFILE_DIR"]
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((name for name in os.listdir(directory)
+                    if name.endswith(".json") and not name.endswith(".speedscope.json")), reverse=True)
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(directory, name)) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary.pop("sql", None)
+        profiles.append(summary)
+    return profiles
+
+
+class ProfileListResource(Resource):
+    @role_required("admin")
+    def get(self):
+        """Newest profiles first, without their SQL; fetch one for the details."""
+        try:
+            limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+        except ValueError:
+            return {"error": "limit must be an integer"}, 400
+        return {"profiles": recent_profiles(limit)}, 200
+
+
+class ProfileResource(Resource):
+    @role_required("admin")
+    def get(self, profile_id):
+        """Download a profile: ?format=json (default), collapsed or speedscope."""
+        suffix = FORMATS.get(request.args.get("format", "json"))
+        if suffix is None:
+            return {"error": f"format must be one of: {', '.join(FORMATS)}"}, 400
+        if not PROFILE_ID.match(profile_id):
+            return {"error": "Profile not found"}, 404
+        directory = current_app.config["PROFILE_DIR"]
+        if not os.path.exists(os.path.join(directory, profile_id + suffix)):
+            return {"error": "Profile not found"}, 404
+        return send_from_directory(directory, profile_id + suffix, as_attachment=suffix != ".json")
+
+
+def init_app(app):
+    if not app.config.get("PROFILE_DIR"):
+        app.config["PROFILE_DIR"] = os.path.join(app.instance_path, "profiles")
+    app.before_request(_start_profile)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown)
@@ -0,0 +1,262 @@
+"""
+"Frequently booked together" recommendations.
+
+`service_affinities` is a sparse matrix stored as one row per non-zero cell:
+
+    kind "service"  customers who had both `service_id` and `ref_id`
+    kind "staff"    bookings and payments for `service_id` with staff member `ref_id`
+
+A batch job (`flask rebuild-recommendations`, and every
+RECOMMENDATION_REBUILD_INTERVAL seconds on the scheduler) rebuilds it from
+bookings and transactions, archives included, with NumPy. In between, every
+new booking or payment adds to it in the writing transaction, the same way
+history.py keeps `user_affinities` (the customer x staff side) current.
+
+Each worker holds the top RECOMMENDATION_MAX_K entries per service and kind
+in memory, so a lookup is a slice. Dropped when a commit changes the matrix
+and reloaded after RECOMMENDATION_CACHE_TTL for other workers' writes.
+"""
+import time
+from collections import Counter, defaultdict
+from threading import Lock
+
+import click
+import numpy as np
+from flask import request
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_restful import Resource
+from jwt.exceptions import PyJWTError
+from sqlalchemy import delete, event, func, insert, select, union_all
+
+from extensions import db
+from metrics import cache_lookup
+from models import (
+    Booking, BookingArchive, Service, ServiceAffinity, Staff, Transaction, TransactionArchive, UserAffinity,
+)
+from scheduler import scheduler
+from staffing import staff_for_service
+from utils import upsert_increment
+
+USER_CHUNK = 65536  # Customers per block of the incidence matrix, to bound its memory
+
+_index = None   # ({(service_id, kind): [(ref_id, weight), ...]}, loaded at)
+_index_lock = Lock()
+_ttl = 300      # Set from config in init_app()
+_max_k = 20
+
+
+def visits_query():
+    """(customer, service, staff) of every non-canceled booking and every payment with a known customer."""
+    return union_all(*(
+        select(model.user_id, model.service_id, model.staff_id).where(model.status != "canceled")
+        for model in (Booking, BookingArchive)
+    ), *(
+        select(model.client_id, model.service_id, model.staff_id).where(model.client_id.isnot(None))
+        for model in (Transaction, TransactionArchive)
+    ))
+
+
+def cooccurrence(users, services):
+    """
+    Service x service counts of customers who had both, from parallel arrays
+    of (customer, service) visits. Returns the service ids and the matrix.
+    """
+    pairs = np.unique(users << 32 | services)
+    user_index = np.unique(pairs >> 32, return_inverse=True)[1]
+    service_ids, service_index = np.unique(pairs & 0xFFFFFFFF, return_inverse=True)
+
+    counts = np.zeros((len(service_ids), len(service_ids)), dtype=np.int64)
+    # Incidence matrix B (customers x services) one block of customers at a time; counts = B^T B
+    bounds = np.searchsorted(user_index, np.arange(0, user_index.max() + USER_CHUNK + 1, USER_CHUNK))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+        rows = user_index[start:end] - user_index[start]
+        block = np.zeros((rows[-1] + 1, len(service_ids)), dtype=np.float32)
+        block[rows, service_index[start:end]] = 1
+        counts += (block.T @ block).astype(np.int64)
+    np.fill_diagonal(counts, 0)
+    return service_ids, counts
+
+
+def rebuild_recommendations():
+    """Recompute `service_affinities` from scratch; returns the number of non-zero cells."""
+    rows = db.session.execute(visits_query(), execution_options={"all_branches": True}).all()
+    db.session.execute(delete(ServiceAffinity))
+    cells = []
+    if rows:
+        users, services, staff = (np.array(column, dtype=np.int64) for column in zip(*rows))
+
+        keys, weights = np.unique(services << 32 | staff, return_counts=True)
+        cells += [
+            {"service_id": int(key >> 32), "kind": "staff", "ref_id": int(key & 0xFFFFFFFF), "weight": int(weight)}
+            for key, weight in zip(keys, weights)
+        ]
+
+        service_ids, counts = cooccurrence(users, services)
+        for row, column in zip(*np.nonzero(counts)):
+            cells.append({"service_id": int(service_ids[row]), "kind": "service",
+                          "ref_id": int(service_ids[column]), "weight": int(counts[row, column])})
+    if cells:
+        db.session.execute(insert(ServiceAffinity), cells)
+    db.session.commit()
+    invalidate_recommendations()
+    return len(cells)
+
+
+def _services_had(connection, user_id):
+    """Visits per service for one customer, including rows flushed by the current transaction."""
+    visits = visits_query().subquery()
+    return Counter(dict(connection.execute(
+        select(visits.c.service_id, func.count()).where(visits.c.user_id == user_id).group_by(visits.c.service_id)
+    ).all()))
+
+
+@event.listens_for(db.session, "after_flush")
+def _count_new_visits(session, flush_context):
+    """Fold new bookings and payments into `service_affinities`, inside the same transaction."""
+    visits = []
+    for obj in session.new:
+        if isinstance(obj, Booking) and obj.status != "canceled":
+            visits.append((obj.user_id, obj.service_id, obj.staff_id))
+        elif isinstance(obj, Transaction) and obj.client_id is not None:
+            visits.append((obj.client_id, obj.service_id, obj.staff_id))
+    if not visits:
+        return
+
+    connection = session.connection()
+    table = ServiceAffinity.__table__
+    new_by_user = defaultdict(Counter)
+    for user_id, service_id, staff_id in visits:
+        upsert_increment(connection, table, {"service_id": service_id, "kind": "staff", "ref_id": staff_id}, {"weight": 1})
+        new_by_user[user_id][service_id] += 1
+
+    # A customer's first visit for a service pairs it with every service they already had
+    for user_id, new in new_by_user.items():
+        had = _services_had(connection, user_id)
+        known = {service_id for service_id, count in had.items() if count > new[service_id]}
+        for service_id in new:
+            if service_id in known:
+                continue
+            for other_id in known:
+                upsert_increment(connection, table, {"service_id": service_id, "kind": "service", "ref_id": other_id}, {"weight": 1})
+                upsert_increment(connection, table, {"service_id": other_id, "kind": "service", "ref_id": service_id}, {"weight": 1})
+            known.add(service_id)
+    session.info["recommendations_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _drop_stale_index(session):
+    if session.info.pop("recommendations_changed", False):
+        invalidate_recommendations()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_new_visits(session):
+    session.info.pop("recommendations_changed", None)
+
+
+def _load_index():
+    index = defaultdict(list)
+    rows = db.session.execute(
+        select(ServiceAffinity.service_id, ServiceAffinity.kind, ServiceAffinity.ref_id, ServiceAffinity.weight)
+        .order_by(ServiceAffinity.service_id, ServiceAffinity.kind, ServiceAffinity.weight.desc(), ServiceAffinity.ref_id)
+    )
+    for service_id, kind, ref_id, weight in rows:
+        top = index[(service_id, kind)]
+        if len(top) < _max_k:
+            top.append((ref_id, weight))
+    return dict(index), time.monotonic()
+
+
+def _get_index():
+    global _index
+    index = _index
+    stale = index is None or time.monotonic() - index[1] > _ttl
+    if stale:
+        with _index_lock:
+            stale = _index is None or time.monotonic() - _index[1] > _ttl
+            if stale:
+                _index = _load_index()
+            index = _index
+    cache_lookup("recommendations", not stale)
+    return index[0]
+
+
+def invalidate_recommendations():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def top_related(service_id, kind, k):
+    """The `k` strongest (ref_id, weight) entries for a service, strongest first."""
+    return _get_index().get((service_id, kind), [])[:k]
+
+
+def _current_user_id():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except (JWTExtendedException, PyJWTError):
+        return None
+
+
+class ServiceRecommendationsResource(Resource):
+    def get(self, service_id):
+        """Services customers also booked, and staff for this service (the signed-in customer's regulars first)."""
+        try:
+            k = min(max(int(request.args.get("k", 5)), 1), _max_k)
+        except ValueError:
+            return {"error": "k must be an integer"}, 400
+        if db.session.get(Service, service_id) is None:
+            return {"error": "Service not found"}, 404
+
+        # Names come from a lookup by id, which also drops deleted and other-branch entries
+        related = top_related(service_id, "service", _max_k)
+        names = dict(db.session.execute(
+            select(Service.id, Service.name).where(Service.id.in_([ref_id for ref_id, _ in related]))
+        ).all())
+        also_booked = [
+            {"id": ref_id, "name": names[ref_id], "customers": weight}
+            for ref_id, weight in related if ref_id in names
+        ][:k]
+
+        qualified = staff_for_service(service_id)
+        visits = dict(top_related(service_id, "staff", _max_k))
+        regulars = {}
+        user_id = _current_user_id()
+        if user_id is not None:
+            regulars = dict(db.session.execute(
+                select(UserAffinity.ref_id, UserAffinity.visits)
+                .where(UserAffinity.user_id == user_id, UserAffinity.kind == "staff")
+            ).all())
+        candidates = sorted(
+            (staff_id for staff_id in set(visits) | set(regulars) if staff_id in qualified),
+            key=lambda staff_id: (-regulars.get(staff_id, 0), -visits.get(staff_id, 0), staff_id),
+        )[:k]
+        staff_names = dict(db.session.execute(select(Staff.id, Staff.name).where(Staff.id.in_(candidates))).all())
+        staff = [
+            {"id": staff_id, "name": staff_names[staff_id], "visits": visits.get(staff_id, 0),
+             "your_visits": regulars.get(staff_id, 0)}
+            for staff_id in candidates if staff_id in staff_names
+        ]
+        return {"service_id": service_id, "also_booked": also_booked, "staff": staff}, 200
+
+
+@click.command("rebuild-recommendations")
+@with_appcontext
+def rebuild_recommendations_command():
+    """Recompute the service co-occurrence matrix from bookings and transactions."""
+    click.echo(f"Rebuilt recommendations: {rebuild_recommendations()} non-zero cells")
+
+
+def init_app(app):
+    global _ttl, _max_k
+    _ttl = app.config["RECOMMENDATION_CACHE_TTL"]
+    _max_k = app.config["RECOMMENDATION_MAX_K"]
+    invalidate_recommendations()
+    app.cli.add_command(rebuild_recommendations_command)
+    scheduler.add_job("recommendations_rebuild", rebuild_recommendations, app.config["RECOMMENDATION_REBUILD_INTERVAL"])
@@ -0,0 +1,253 @@
+"""
+Read-replica routing.
+
+Requests that can't write (GET/HEAD/OPTIONS) read from one of the
+`SQLALCHEMY_REPLICA_URIS` engines; everything else, and anything a read-only
+request ends up writing, goes to the primary. A client that just wrote is
+pinned to the primary for `REPLICA_PIN_SECONDS` with a cookie, so the booking
+they made is on the next page even if the replica hasn't replayed it yet.
+
+Replicas are probed every `REPLICA_HEALTH_INTERVAL` seconds (and dropped at
+once when a query on them fails to connect) and are only used while they
+answer and, on PostgreSQL, lag less than `REPLICA_MAX_LAG` seconds. With none
+healthy every query goes to the primary.
+
+`BRANCH_DATABASE_URIS` gives a branch its own read bind, e.g. a PostgreSQL
+subscriber to a publication filtered on `branch_id` (plus the shared tables
+in full). Read-only requests scoped to that branch (branches.py) read there,
+so its reports never touch another branch's rows; unscoped requests never
+use it, since it only holds part of the data.
+
+This module must not import `extensions` (which installs `RoutingSession`).
+"""
+import random
+import threading
+import time
+
+import click
+from flask import current_app, g, has_request_context, request
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "db_primary_until"
+
+# Seconds a streaming replica is behind; 0 when it has replayed everything it received
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    __slots__ = ("name", "engine", "healthy", "lag", "error")
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+        self.lag = None
+        self.error = None
+
+
+_replicas = []
+_branch_replicas = {}  # branch id -> Replica holding only that branch's rows
+_last_check = 0.0
+_check_lock = threading.Lock()
+_health_interval = 10  # Set from config in init_app()
+_max_lag = 10.0
+
+
+def _mark_down(replica, error):
+    if replica.healthy:
+        current_app.logger.warning("Read replica %s dropped: %s", replica.name, str(error).splitlines()[0])
+    replica.healthy = False
+    replica.error = str(error).splitlines()[0]
+
+
+def check_replica(replica):
+    try:
+        with replica.engine.connect() as connection:
+            if connection.dialect.name == "postgresql":
+                lag = connection.execute(POSTGRES_LAG_SQL).scalar()
+                replica.lag = float(lag) if lag is not None else None
+            else:
+                connection.execute(text("SELECT 1"))
+                replica.lag = 0.0
+    except Exception as exc:
+        _mark_down(replica, exc)
+        return False
+
+    if replica.lag is not None and replica.lag > _max_lag:
+        _mark_down(replica, f"{replica.lag:.1f}s behind the primary")
+        return False
+    if not replica.healthy:
+        current_app.logger.info("Read replica %s is back", replica.name)
+    replica.healthy = True
+    replica.error = None
+    return True
+
+
+def _all_replicas():
+    return _replicas + list(_branch_replicas.values())
+
+
+def check_replicas():
+    """Probe every replica now and update which ones take reads."""
+    global _last_check
+    _last_check = time.monotonic()
+    return [check_replica(replica) for replica in _all_replicas()]
+
+
+def _pick_replica():
+    if time.monotonic() - _last_check > _health_interval and _check_lock.acquire(blocking=False):
+        # One request re-probes; the others go on with the current state
+        try:
+            check_replicas()
+        finally:
+            _check_lock.release()
+    branch_replica = _branch_replicas.get(g.get("branch_id"))
+    if branch_replica is not None and branch_replica.healthy:
+        return branch_replica
+    healthy = [replica for replica in _replicas if replica.healthy]
+    return random.choice(healthy) if healthy else None
+
+
+def _writes(clause):
+    return getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy's session, with reads of read-only requests sent to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (bind is not None or not (_replicas or _branch_replicas) or not has_request_context() or not g.get("db_read_only")
+                or self._flushing or self.info.get("db_wrote") or _writes(clause)
+                or engine is not self._db.engines.get(None)):
+            return engine
+
+        # One replica for the whole session, so a request's reads agree with each other
+        if "replica" not in self.info:
+            replica = _pick_replica()
+            if replica is not None:
+                try:
+                    # Check out the connection now: if the replica is gone this
+                    # request falls back to the primary instead of failing
+                    self.connection(bind_arguments={"bind": replica.engine})
+                except DBAPIError:
+                    replica = None
+            self.info["replica"] = replica
+        replica = self.info["replica"]
+        return replica.engine if replica is not None else engine
+
+    def commit(self):
+        if self.info.get("hold_commits"):
+            # Whoever set it commits once the work is done, e.g. idempotency.py with the stored response
+            self.flush()
+            return
+        super().commit()
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _note_flush(session, flush_context):
+    session.info["db_wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute", insert=True)
+def _note_statement(orm_execute_state):
+    # Runs before the other listeners, so their `session.connection()` calls reach the primary too
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["db_wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_writer(session):
+    wrote = session.info.pop("db_wrote", False)
+    if not (_replicas or _branch_replicas):
+        return  # Everything reads the primary already; no cookie to pin
+    if wrote and has_request_context():
+        g.db_read_only = False  # Later reads in this request see the write too
+        g.db_pin = True
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_writes(session):
+    session.info.pop("db_wrote", None)
+
+
+def _route_request():
+    if not (_replicas or _branch_replicas):
+        return
+    try:
+        pinned = float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        pinned = False
+    g.db_read_only = request.method in READ_METHODS and not pinned
+
+
+def _set_pin(response):
+    if (_replicas or _branch_replicas) and g.get("db_pin"):
+        seconds = current_app.config["REPLICA_PIN_SECONDS"]
+        response.set_cookie(
+            PIN_COOKIE, f"{time.time() + seconds:.0f}", max_age=seconds, httponly=True,
+            secure=current_app.config["JWT_COOKIE_SECURE"], samesite=current_app.config.get("JWT_COOKIE_SAMESITE"),
+        )
+    return response
+
+
+def replica_engines():
+    return {replica.name: replica.engine for replica in _all_replicas()}
+
+
+def dispose_replicas(close=True):
+    for replica in _all_replicas():
+        replica.engine.dispose(close=close)
+
+
+def _connect(uri, label=""):
+    engine = create_engine(uri, pool_pre_ping=True)
+    replica = Replica(label + engine.url.render_as_string(hide_password=True), engine)
+    _watch(replica)
+    return replica
+
+
+def _watch(replica):
+    dbapi_error = replica.engine.dialect.loaded_dbapi.OperationalError
+
+    @event.listens_for(replica.engine, "handle_error")
+    def _drop_on_connection_error(context):
+        if context.is_disconnect or isinstance(context.original_exception, dbapi_error):
+            _mark_down(replica, context.original_exception)
+
+
+@click.command("check-replicas")
+@with_appcontext
+def check_replicas_command():
+    """Probe the read replicas and print their state."""
+    if not (_replicas or _branch_replicas):
+        click.echo("No read replicas configured (SQLALCHEMY_REPLICA_URIS, BRANCH_DATABASE_URIS).")
+        return
+    for replica, healthy in zip(_all_replicas(), check_replicas()):
+        detail = f"lag {replica.lag:.1f}s" if healthy and replica.lag is not None else replica.error or ""
+        click.echo(f"{replica.name}: {'up' if healthy else 'down'} {detail}".rstrip())
+
+
+def init_app(app):
+    global _health_interval, _max_lag, _last_check
+    _health_interval = app.config["REPLICA_HEALTH_INTERVAL"]
+    _max_lag = app.config["REPLICA_MAX_LAG"]
+    _last_check = 0.0
+    dispose_replicas()
+    _replicas.clear()
+    _branch_replicas.clear()
+    for uri in app.config["SQLALCHEMY_REPLICA_URIS"]:
+        _replicas.append(_connect(uri))
+    for branch_id, uri in app.config["BRANCH_DATABASE_URIS"].items():
+        _branch_replicas[branch_id] = _connect(uri, f"branch {branch_id}: ")
+
+    app.before_request(_route_request)
+    app.after_request(_set_pin)
+    app.cli.add_command(check_replicas_command)
@@ -1,75 +1,72 @@
 from flask import jsonify
 from flask_restful import Resource
 from datetime import datetime, timedelta
-from models import db, Transaction, Staff, Service
+from sqlalchemy import select
+from models import db, Staff, Service
+from archive import revenue_query, all_time_counts, transaction_rows
+from pricing import price_at_query
 
-class ReportsResource(Resource):
-    def get(self):
-        now = datetime.utcnow()
+# Report fields returned as top-3 lists rather than single numbers
+RANKED_FIELDS = ("most_booked_staff", "most_booked_service")
 
-        try:
-            # Get total services & staff count
-            total_services = db.session.query(Service).count()
-            total_staff = db.session.query(Staff).count()
 
-            # Daily revenue
-            start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            daily_revenue = (
-                db.session.query(db.func.sum(Transaction.amount_paid))
-                .filter(Transaction.booking_time >= start_of_day)
-                .scalar() or 0
-            )
+def _most_booked(model, column):
+    counts = all_time_counts(column)
+    return (
+        select(model.name, db.func.sum(counts.c.count))
+        .join(counts, counts.c.key == model.id)
+        .group_by(model.id)
+        .order_by(db.func.sum(counts.c.count).desc())
+        .limit(3)
+    )
+
+
+def list_price_revenue_query(start):
+    """What transactions since `start` should have brought in at the list prices in effect when they happened."""
+    rows = transaction_rows(start=start)
+    return select(db.func.sum(price_at_query(rows.c.service_id, rows.c.booking_time))).select_from(rows)
+
 
-            # Weekly revenue
-            start_of_week = start_of_day - timedelta(days=start_of_day.weekday())
-            weekly_revenue = (
-                db.session.query(db.func.sum(Transaction.amount_paid))
-                .filter(Transaction.booking_time >= start_of_week)
-                .scalar() or 0
-            )
+def report_statements(now):
+    """
+    The statements behind /reports, keyed by response field. They are plain
+    selects so the sync resource and the async server (asgi.py) share them.
+    """
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_of_week = start_of_day - timedelta(days=start_of_day.weekday())
+    start_of_month = start_of_day.replace(day=1)
 
-            # Monthly revenue
-            start_of_month = start_of_day.replace(day=1)
-            monthly_revenue = (
-                db.session.query(db.func.sum(Transaction.amount_paid))
-                .filter(Transaction.booking_time >= start_of_month)
-                .scalar() or 0
-            )
+    return {
+        # Get total services & staff count
+        "total_services": select(db.func.count(Service.id)),
+        "total_staff": select(db.func.count(Staff.id)),
+        # Daily, weekly and monthly revenue
+        "daily_revenue": revenue_query(start_of_day),
+        "weekly_revenue": revenue_query(start_of_week),
+        "monthly_revenue": revenue_query(start_of_month),
+        # Monthly revenue at historical list prices, to reconcile against monthly_revenue
+        "monthly_list_revenue": list_price_revenue_query(start_of_month),
+        # Most booked staff & service
+        "most_booked_staff": _most_booked(Staff, "staff_id"),
+        "most_booked_service": _most_booked(Service, "service_id"),
+    }
 
-            # Most booked staff
-            most_booked_staff = (
-                db.session.query(Staff.name, db.func.count(Transaction.id))
-                .join(Transaction)
-                .group_by(Staff.id)
-                .order_by(db.func.count(Transaction.id).desc())
-                .limit(3)
-                .all()
-            )
-            most_booked_staff = [
-                {"name": staff[0], "count": staff[1]} for staff in most_booked_staff
-            ]
 
-            # Most booked service
-            most_booked_service = (
-                db.session.query(Service.name, db.func.count(Transaction.id))
-                .join(Transaction)
-                .group_by(Service.id)
-                .order_by(db.func.count(Transaction.id).desc())
-                .limit(3)
-                .all()
-            )
-            most_booked_service = [
-                {"name": service[0], "count": service[1]} for service in most_booked_service
-            ]
+def report_value(field, result):
+    """Shape one executed statement's result for the /reports response."""
+    if field in RANKED_FIELDS:
+        return [{"name": row[0], "count": row[1]} for row in result]
+    return result.scalar() or 0
 
+
+class ReportsResource(Resource):
+    def get(self):
+        now = datetime.utcnow()
+
+        try:
             return jsonify({
-                "total_services": total_services,
-                "total_staff": total_staff,
-                "daily_revenue": daily_revenue,
-                "weekly_revenue": weekly_revenue,
-                "monthly_revenue": monthly_revenue,
-                "most_booked_staff": most_booked_staff,
-                "most_booked_service": most_booked_service
+                field: report_value(field, db.session.execute(statement))
+                for field, statement in report_statements(now).items()
             })
 
         except Exception as e:
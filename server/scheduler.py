@@ -0,0 +1,62 @@
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import db
+
+
+class Scheduler:
+    """
+    Tiny periodic runner. Each job runs inside an app context. Jobs don't
+    coordinate with each other's copies, so exactly one process per database
+    runs them: `flask scheduler`, never the web workers.
+    """
+
+    def __init__(self, tick=1.0):
+        self.tick = tick
+        self._jobs = {}
+        self._stop = threading.Event()
+
+    def add_job(self, name, func, interval):
+        self._jobs[name] = {"func": func, "interval": interval, "next_run": 0.0}
+
+    def run_pending(self, app):
+        now = time.monotonic()
+        for name, job in self._jobs.items():
+            if now < job["next_run"]:
+                continue
+            job["next_run"] = now + job["interval"]
+            with app.app_context():
+                try:
+                    job["func"]()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Scheduled job %s failed", name)
+                finally:
+                    db.session.remove()
+
+    def run_forever(self, app):
+        """Run jobs as they come due, in this thread, until `stop()`."""
+        self._stop.clear()
+        while not self._stop.wait(self.tick):
+            self.run_pending(app)
+
+    def stop(self):
+        self._stop.set()
+
+
+scheduler = Scheduler()
+
+
+@click.command("scheduler")
+@with_appcontext
+def scheduler_command():
+    """Run the scheduled jobs until interrupted. Run exactly one of these per database."""
+    click.echo(f"Running {', '.join(scheduler._jobs)}")
+    try:
+        scheduler.run_forever(current_app._get_current_object())
+    except KeyboardInterrupt:
+        pass
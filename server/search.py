@@ -0,0 +1,212 @@
+import re
+from collections import defaultdict
+
+import click
+from flask import request
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_restful import Resource
+from jwt.exceptions import PyJWTError
+from sqlalchemy import bindparam, event, or_, text
+
+from extensions import db
+from models import Review, Service, Staff, User
+
+# Indexed document kinds. The FTS rowid is `ref_id * len(SEARCH_KINDS) + code`,
+# so reindexing or deleting one document is a rowid lookup, not a scan.
+SEARCH_KINDS = {"service": 0, "staff": 1, "user": 2, "review": 3}
+KIND_MODELS = {"service": Service, "staff": Staff, "user": User, "review": Review}
+MODEL_KINDS = {model: kind for kind, model in KIND_MODELS.items()}
+
+# Columns matched for each kind; the first one ranks highest in the LIKE fallback
+SEARCH_FIELDS = {
+    "service": ("name",),
+    "staff": ("name", "role"),
+    "user": ("name", "username", "email"),
+    "review": ("review",),
+}
+
+# Columns returned for each hit
+RESULT_FIELDS = {
+    "service": ("name", "picture", "price"),
+    "staff": ("name", "picture", "role"),
+    "user": ("name", "username", "email"),
+    "review": ("staff_id", "rating", "review"),
+}
+
+ADMIN_ONLY_KINDS = {"user"}
+MAX_PER_PAGE = 50
+
+_fts_available = {}
+
+
+def _rowid(kind, ref_id):
+    return ref_id * len(SEARCH_KINDS) + SEARCH_KINDS[kind]
+
+
+def _document(kind, obj):
+    return " ".join(str(getattr(obj, field) or "") for field in SEARCH_FIELDS[kind])
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def fts_enabled(connection):
+    """True when the bind is SQLite and the FTS5 `search_index` table exists."""
+    if connection.dialect.name != "sqlite":
+        return False
+    key = str(connection.engine.url)
+    if key not in _fts_available:
+        _fts_available[key] = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+        ).first() is not None
+    return _fts_available[key]
+
+
+def create_search_index():
+    """Create the FTS5 table on SQLite; `create_all` doesn't know about virtual tables."""
+    if db.engine.dialect.name != "sqlite":
+        return
+    db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(content, tokenize='unicode61')"))
+    db.session.commit()
+    _fts_available.clear()
+
+
+def rebuild_search_index():
+    create_search_index()
+    if not fts_enabled(db.session.connection()):
+        return 0
+
+    db.session.execute(text("DELETE FROM search_index"))
+    indexed = 0
+    for kind, model in KIND_MODELS.items():
+        columns = [model.id] + [getattr(model, field) for field in SEARCH_FIELDS[kind]]
+        rows = [
+            {"rowid": _rowid(kind, row[0]), "content": " ".join(str(value or "") for value in row[1:])}
+            for row in db.session.query(*columns)
+        ]
+        if rows:
+            db.session.execute(text("INSERT INTO search_index (rowid, content) VALUES (:rowid, :content)"), rows)
+        indexed += len(rows)
+    db.session.commit()
+    return indexed
+
+
+@event.listens_for(db.session, "after_flush")
+def _sync_index(session, flush_context):
+    """Keep `search_index` in step with writes, inside the same transaction."""
+    changed = [obj for obj in list(session.new) + list(session.dirty) if type(obj) in MODEL_KINDS]
+    deleted = [obj for obj in session.deleted if type(obj) in MODEL_KINDS]
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    if not fts_enabled(connection):
+        return
+
+    stale = [{"rowid": _rowid(MODEL_KINDS[type(obj)], obj.id)} for obj in changed + deleted]
+    connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), stale)
+    if changed:
+        connection.execute(
+            text("INSERT INTO search_index (rowid, content) VALUES (:rowid, :content)"),
+            [{"rowid": _rowid(MODEL_KINDS[type(obj)], obj.id), "content": _document(MODEL_KINDS[type(obj)], obj)}
+             for obj in changed],
+        )
+
+
+def _fts_hits(terms, kinds, limit, offset):
+    match = " ".join(f'"{term}"*' for term in terms)  # Every term, each as a prefix
+    rows = db.session.execute(
+        text(
+            "SELECT rowid FROM search_index "
+            "WHERE search_index MATCH :match AND rowid % :kind_count IN :codes "
+            "ORDER BY bm25(search_index) LIMIT :limit OFFSET :offset"
+        ).bindparams(bindparam("codes", expanding=True)),
+        {"match": match, "kind_count": len(SEARCH_KINDS), "codes": [SEARCH_KINDS[kind] for kind in kinds],
+         "limit": limit, "offset": offset},
+    )
+    codes = {code: kind for kind, code in SEARCH_KINDS.items()}
+    return [(codes[rowid % len(SEARCH_KINDS)], rowid // len(SEARCH_KINDS)) for (rowid,) in rows]
+
+
+def _like_hits(terms, kinds, limit, offset):
+    """Fallback for databases without FTS5; a pg_trgm index on Postgres keeps the ILIKEs indexed."""
+    hits = []
+    for kind in kinds:
+        model = KIND_MODELS[kind]
+        fields = [db.cast(getattr(model, field), db.String) for field in SEARCH_FIELDS[kind]]
+        query = db.session.query(model.id, fields[0])
+        for term in terms:
+            query = query.filter(or_(*(field.ilike(f"%{term}%") for field in fields)))
+        for ref_id, primary in query.limit(offset + limit):
+            rank = 0 if (primary or "").lower().startswith(terms[0]) else 1
+            hits.append((rank, kind, ref_id))
+    hits.sort(key=lambda hit: hit[0])
+    return [(kind, ref_id) for _, kind, ref_id in hits[offset:offset + limit]]
+
+
+def search(query, kinds, page=1, per_page=20):
+    """Ranked, paginated hits as `(results, has_more)`."""
+    terms = _terms(query)
+    if not terms or not kinds:
+        return [], False
+
+    find = _fts_hits if fts_enabled(db.session.connection()) else _like_hits
+    hits = find(terms, kinds, per_page + 1, (page - 1) * per_page)
+    has_more = len(hits) > per_page
+    hits = hits[:per_page]
+
+    # One IN query per kind to fetch display fields
+    ids_by_kind = defaultdict(list)
+    for kind, ref_id in hits:
+        ids_by_kind[kind].append(ref_id)
+    rows = {}
+    for kind, ids in ids_by_kind.items():
+        model = KIND_MODELS[kind]
+        columns = [getattr(model, field) for field in RESULT_FIELDS[kind]]
+        for row in db.session.query(model.id, *columns).filter(model.id.in_(ids)):
+            rows[(kind, row[0])] = dict(zip(RESULT_FIELDS[kind], row[1:]))
+
+    results = [{"type": kind, "id": ref_id, **rows[(kind, ref_id)]} for kind, ref_id in hits if (kind, ref_id) in rows]
+    return results, has_more
+
+
+class SearchResource(Resource):
+    def get(self):
+        """Search services, staff, reviews and (for admins) customers: /search?q=bra&type=service,staff&page=1"""
+        query = request.args.get("q", "").strip()
+        if not query:
+            return {"error": "Missing search query"}, 400
+
+        try:
+            is_admin = bool(verify_jwt_in_request(optional=True)) and get_jwt().get("role") == "admin"
+        except (JWTExtendedException, PyJWTError):
+            is_admin = False
+        allowed = [kind for kind in SEARCH_KINDS if is_admin or kind not in ADMIN_ONLY_KINDS]
+
+        requested = request.args.get("type")
+        kinds = allowed if not requested else [kind for kind in requested.split(",") if kind in allowed]
+        if requested and not kinds:
+            return {"error": f"Invalid type. Choose from: {', '.join(allowed)}"}, 400
+
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+            per_page = min(max(int(request.args.get("per_page", 20)), 1), MAX_PER_PAGE)
+        except ValueError:
+            return {"error": "page and per_page must be integers"}, 400
+
+        results, has_more = search(query, kinds, page, per_page)
+        return {"query": query, "page": page, "per_page": per_page, "has_more": has_more, "results": results}, 200
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Recreate the search index from the services, staff, users and reviews tables."""
+    click.echo(f"indexed: {rebuild_search_index()}")
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_search_index_command)
@@ -1,12 +1,19 @@
-from config import db, app
-from models import User, Staff, Service, StaffService, Review, Transaction, Booking
+from config import create_app
+from extensions import db
+from models import Branch, User, Staff, Service, StaffService, Review, Transaction, Booking
 from datetime import datetime, timedelta
+from search import rebuild_search_index
 
 def seed_data():
+    app = create_app()
     with app.app_context():
         db.drop_all()
         db.create_all()
 
+        print("Seeding Branches...")
+        db.session.add(Branch(id=1, name="Main"))
+        db.session.commit()
+
         print("Seeding Users...")
         users = [
             User(
@@ -119,6 +126,9 @@ def seed_data():
         db.session.add_all(bookings)
         db.session.commit()
 
+        print("Indexing Search...")
+        rebuild_search_index()
+
         print("Seeding Complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""
+Declarative response schemas.
+
+A `Schema` is compiled once at import: the output keys, the column each one
+reads and how its value is converted. List endpoints select exactly those
+columns and build dicts straight from the result rows, so no ORM objects,
+relationship loads or per-row `to_dict()` calls are involved.
+"""
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import make_response
+from sqlalchemy import Date, DateTime, func, select
+
+from extensions import db
+from models import Booking, Review, Service, Staff, StaffService, Transaction, User
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used instead
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Encode `data` as compact JSON bytes, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json using `dumps`."""
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = "application/json"
+    return response
+
+
+class Field:
+    """
+    One output key. `expression` is a column, a SQL expression, the name of a
+    column on the source passed to `Schema.select()`, or a callable taking
+    that source.
+    """
+    __slots__ = ("name", "expression", "default", "iso")
+
+    def __init__(self, expression, name=None, default=None, iso=None):
+        if name is None:
+            name = expression if isinstance(expression, str) else expression.key
+        if iso is None:
+            iso = isinstance(getattr(expression, "type", None), (DateTime, Date))
+        self.name = name
+        self.expression = expression
+        self.default = default
+        self.iso = iso
+
+    def resolve(self, source):
+        if isinstance(self.expression, str):
+            return source.c[self.expression]
+        if hasattr(self.expression, "__clause_element__") or hasattr(self.expression, "type"):
+            return self.expression
+        return self.expression(source)
+
+    def converter(self):
+        default = self.default
+        if self.iso:
+            return lambda value: value.isoformat() if value is not None else default
+        if default is not None:
+            return lambda value: default if value is None else value
+        return None
+
+
+class Schema:
+    def __init__(self, *fields):
+        self.fields = [field if isinstance(field, Field) else Field(field) for field in fields]
+        self.keys = tuple(field.name for field in self.fields)
+        # Only fields that need work get a converter; the rest are copied as-is
+        self._converters = [
+            (index, convert) for index, convert in ((i, f.converter()) for i, f in enumerate(self.fields))
+            if convert is not None
+        ]
+
+    def select(self, source=None):
+        columns = [field.resolve(source).label(field.name) for field in self.fields]
+        query = select(*columns)
+        return query.select_from(source) if source is not None else query
+
+    def dump_row(self, row):
+        if self._converters:
+            row = list(row)
+            for index, convert in self._converters:
+                row[index] = convert(row[index])
+        return dict(zip(self.keys, row))
+
+    def dump(self, rows):
+        return [self.dump_row(row) for row in rows]
+
+    def dump_obj(self, obj):
+        """Serialize an ORM object (e.g. one just written) with the same plan."""
+        return self.dump_row([getattr(obj, field.name) for field in self.fields])
+
+    def all(self, query):
+        return self.dump(db.session.execute(query))
+
+
+def related_ids(key, value, where=None):
+    """`{key: [value, ...]}` from one grouped query, e.g. service ids per staff member."""
+    query = select(key, value).order_by(value)
+    if where is not None:
+        query = query.where(where)
+    grouped = defaultdict(list)
+    for owner, related in db.session.execute(query):
+        grouped[owner].append(related)
+    return grouped
+
+
+SERVICE = Schema(Service.id, Service.name, Service.picture, Service.price, Service.time_taken, Service.branch_id)
+
+STAFF = Schema(
+    Staff.id, Staff.name, Staff.picture,
+    Field(Staff.gender, default="not specified"),
+    Field(Staff.role, default="not specified"),
+    Staff.branch_id,
+)
+
+# Relationship id lists that the staff payload has always carried
+STAFF_RELATED = {
+    "services": (StaffService.staff_id, StaffService.service_id),
+    "reviews": (Review.staff_id, Review.id),
+    "transactions": (Transaction.staff_id, Transaction.id),
+    "bookings": (Booking.staff_id, Booking.id),
+}
+
+
+def staff_payload(staff_id=None):
+    """Staff rows plus their related id lists: one query for the rows and one per relationship."""
+    query = STAFF.select().order_by(Staff.id)
+    if staff_id is not None:
+        query = query.where(Staff.id == staff_id)
+    staff = STAFF.all(query)
+    if not staff:
+        return staff
+    for name, (key, value) in STAFF_RELATED.items():
+        grouped = related_ids(key, value, key == staff_id if staff_id is not None else None)
+        for member in staff:
+            member[name] = grouped.get(member["id"], [])
+    return staff
+
+
+REVIEW = Schema(Review.id, Review.staff_id, Review.client_id, Review.rating, Review.review)
+
+STAFF_REVIEW = Schema(Review.staff_id, Review.rating, Review.review, Field(User.name, "client"))
+
+BOOKING_LIST = Schema(
+    Booking.id,
+    Field(Service.name, "service"),
+    Field(Staff.name, "staff"),
+    Field(User.username, "user"),
+    Booking.booking_time,
+)
+
+TRANSACTION_LIST = Schema(
+    Field("id"),
+    Field(Service.name, "service_name", default="Unknown"),
+    Field(Staff.name, "staff_name", default="Unknown"),
+    Field(lambda rows: func.coalesce(User.name, rows.c.client_name), "client_name"),
+    Field("amount_paid"),
+    Field("time_taken"),
+    Field("booking_time", iso=True),
+)
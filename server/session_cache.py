@@ -0,0 +1,159 @@
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+from cachetools import TTLCache
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.orm import object_session
+
+from extensions import db, jwt
+from metrics import cache_lookup
+from models import TokenRevocation, User
+from scheduler import scheduler
+from utils import upsert_increment
+
+# Fields copied into the access token so /check_session never has to hit the database
+CLAIM_FIELDS = ("username", "email", "role")
+
+_user_cache = TTLCache(maxsize=4096, ttl=60)  # Resized from config in init_app()
+_user_cache_lock = Lock()
+
+# Revocations are rows in `token_revocations`, shared by every worker. Each
+# worker reads them all into memory (they are few: logouts within an access
+# token's lifetime, claim changes within a refresh token's), at most
+# REVOCATION_CACHE_TTL seconds old, and right away after committing one itself.
+_revoked_tokens = frozenset()  # jtis
+_revoked_users = {}            # user id -> unix time; tokens issued before that second are rejected
+_revocations_loaded = None     # time.monotonic() of the last load; None forces a reload
+_revocation_lock = Lock()
+_revocation_ttl = 5            # Set from config in init_app()
+_user_revocation_lifetime = timedelta(days=30)
+
+
+def user_claims(user):
+    return {field: getattr(user, field) for field in CLAIM_FIELDS}
+
+
+def get_user_profile(user_id):
+    """Return `{"id", "username", "email", "role"}` for a user, from cache when possible."""
+    user_id = int(user_id)
+    with _user_cache_lock:
+        profile = _user_cache.get(user_id)
+    cache_lookup("user_profile", profile is not None)
+    if profile is not None:
+        return profile
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+
+    profile = {"id": user.id, **user_claims(user)}
+    with _user_cache_lock:
+        _user_cache[user_id] = profile
+    return profile
+
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(int(user_id), None)
+
+
+def _store_revocation(connection, kind, ref, expires_at):
+    upsert_increment(
+        connection, TokenRevocation.__table__, {"kind": kind, "ref": str(ref)}, {},
+        latest={"revoked_at": int(time.time()), "expires_at": expires_at},  # Same whole-second resolution as `iat`
+    )
+
+
+def revoke_token(jwt_payload):
+    """Reject this token from now on, in every worker."""
+    expires_at = datetime.utcfromtimestamp(jwt_payload.get("exp", time.time() + 86400))
+    _store_revocation(db.session.connection(), "token", jwt_payload["jti"], expires_at)
+    db.session.commit()
+    invalidate_revocations()
+
+
+def revoke_user_tokens(connection, user_id):
+    """
+    Reject every token issued to this user so far, e.g. after their claims
+    changed. Written on `connection`, so it commits with the change.
+    """
+    _store_revocation(connection, "user", user_id, datetime.utcnow() + _user_revocation_lifetime)
+
+
+def invalidate_revocations():
+    global _revocations_loaded
+    with _revocation_lock:
+        _revocations_loaded = None
+
+
+def _current_revocations():
+    global _revoked_tokens, _revoked_users, _revocations_loaded
+    with _revocation_lock:
+        fresh = _revocations_loaded is not None and time.monotonic() - _revocations_loaded < _revocation_ttl
+    cache_lookup("revocations", fresh)
+    if not fresh:
+        loaded_at = time.monotonic()
+        rows = db.session.execute(
+            select(TokenRevocation.kind, TokenRevocation.ref, TokenRevocation.revoked_at)
+            .where(TokenRevocation.expires_at > datetime.utcnow())
+        ).all()
+        with _revocation_lock:
+            _revoked_tokens = frozenset(ref for kind, ref, _ in rows if kind == "token")
+            _revoked_users = {ref: revoked_at for kind, ref, revoked_at in rows if kind == "user"}
+            _revocations_loaded = loaded_at
+    return _revoked_tokens, _revoked_users
+
+
+def prune_revocations(now=None):
+    result = db.session.execute(
+        delete(TokenRevocation).where(TokenRevocation.expires_at < (now or datetime.utcnow()))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    global _user_cache, _revocation_ttl, _user_revocation_lifetime
+    _user_cache = TTLCache(maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"])
+    _revocation_ttl = app.config["REVOCATION_CACHE_TTL"]
+    # Long enough to outlive every token issued before the revocation
+    _user_revocation_lifetime = max(app.config["JWT_ACCESS_TOKEN_EXPIRES"], app.config["JWT_REFRESH_TOKEN_EXPIRES"])
+    invalidate_revocations()
+    scheduler.add_job("revocation_prune", prune_revocations, app.config["REVOCATION_PRUNE_INTERVAL"])
+
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    revoked_tokens, revoked_users = _current_revocations()
+    if jwt_payload["jti"] in revoked_tokens:
+        return True
+    revoked_at = revoked_users.get(jwt_payload["sub"])
+    return revoked_at is not None and jwt_payload["iat"] < revoked_at
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, user):
+    invalidate_user(user.id)
+    state = inspect(user)
+    if any(state.attrs[field].history.has_changes() for field in CLAIM_FIELDS):
+        revoke_user_tokens(connection, user.id)
+        object_session(user).info["revocations_changed"] = True
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, user):
+    invalidate_user(user.id)
+    revoke_user_tokens(connection, user.id)
+    object_session(user).info["revocations_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _reload_revocations(session):
+    if session.info.pop("revocations_changed", False):
+        invalidate_revocations()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_revocations(session):
+    session.info.pop("revocations_changed", None)
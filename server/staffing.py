@@ -0,0 +1,155 @@
+import time
+from collections import defaultdict
+from threading import Lock
+
+from flask_restful import Resource
+from sqlalchemy import event, select
+
+from extensions import db
+from models import Service, Staff, StaffService
+from http_cache import conditional
+from metrics import cache_lookup
+from utils import role_required
+
+# Which staff can perform which service, in both directions. Loaded with one
+# query, dropped whenever a commit touches `staff_service`, and reloaded after
+# STAFFING_CACHE_TTL so other worker processes pick up changes too.
+_mapping = None   # (staff id -> service ids, service id -> staff ids, loaded at)
+_mapping_lock = Lock()
+_ttl = 60  # Set from config in init_app()
+
+
+def _load_mapping():
+    services_by_staff, staff_by_service = defaultdict(set), defaultdict(set)
+    for staff_id, service_id in db.session.execute(select(StaffService.staff_id, StaffService.service_id)):
+        services_by_staff[staff_id].add(service_id)
+        staff_by_service[service_id].add(staff_id)
+    return (
+        {staff_id: frozenset(ids) for staff_id, ids in services_by_staff.items()},
+        {service_id: frozenset(ids) for service_id, ids in staff_by_service.items()},
+        time.monotonic(),
+    )
+
+
+def _get_mapping():
+    global _mapping
+    mapping = _mapping
+    stale = mapping is None or time.monotonic() - mapping[2] > _ttl
+    if stale:
+        with _mapping_lock:
+            stale = _mapping is None or time.monotonic() - _mapping[2] > _ttl
+            if stale:
+                _mapping = _load_mapping()
+            mapping = _mapping
+    cache_lookup("staffing", not stale)
+    return mapping
+
+
+def invalidate_staffing():
+    global _mapping
+    with _mapping_lock:
+        _mapping = None
+
+
+def services_for_staff(staff_id):
+    return _get_mapping()[0].get(int(staff_id), frozenset())
+
+
+def staff_for_service(service_id):
+    return _get_mapping()[1].get(int(service_id), frozenset())
+
+
+def is_qualified(staff_id, service_id):
+    return int(service_id) in services_for_staff(staff_id)
+
+
+@event.listens_for(db.session, "after_flush")
+def _note_staffing_change(session, flush_context):
+    # Deleting a staff member or service cascades to its links during the flush
+    if any(isinstance(obj, StaffService) for obj in session.new) or \
+            any(isinstance(obj, (StaffService, Staff, Service)) for obj in session.deleted):
+        session.info["staffing_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _drop_stale_mapping(session):
+    # Only after commit, so a concurrent reload can't cache rows that may still roll back
+    if session.info.pop("staffing_changed", False):
+        invalidate_staffing()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_staffing_change(session):
+    session.info.pop("staffing_changed", None)
+
+
+class ServiceStaffResource(Resource):
+    @conditional(Service, Staff, StaffService)
+    def get(self, service_id):
+        """Staff who can perform a service, in one joined query."""
+        rows = db.session.execute(
+            select(Service.id, Staff.id, Staff.name, Staff.picture, Staff.gender, Staff.role)
+            .outerjoin(StaffService, StaffService.service_id == Service.id)
+            .outerjoin(Staff, Staff.id == StaffService.staff_id)
+            .where(Service.id == service_id)
+            .order_by(Staff.id)
+        ).all()
+        if not rows:
+            return {"error": "Service not found"}, 404
+        return [
+            {"id": staff_id, "name": name, "picture": picture,
+             "gender": gender or "not specified", "role": role or "not specified"}
+            for _, staff_id, name, picture, gender, role in rows if staff_id is not None
+        ], 200
+
+
+class StaffServicesResource(Resource):
+    @conditional(Service, Staff, StaffService)
+    def get(self, staff_id):
+        """Services a staff member offers, in one joined query."""
+        rows = db.session.execute(
+            select(Staff.id, Service.id, Service.name, Service.picture, Service.price, Service.time_taken)
+            .outerjoin(StaffService, StaffService.staff_id == Staff.id)
+            .outerjoin(Service, Service.id == StaffService.service_id)
+            .where(Staff.id == staff_id)
+            .order_by(Service.id)
+        ).all()
+        if not rows:
+            return {"error": "Staff not found"}, 404
+        return [
+            {"id": service_id, "name": name, "picture": picture, "price": price, "time_taken": time_taken}
+            for _, service_id, name, picture, price, time_taken in rows if service_id is not None
+        ], 200
+
+
+class StaffServiceLinkResource(Resource):
+    @role_required("admin")
+    def put(self, staff_id, service_id):
+        """Let a staff member perform a service."""
+        staff = db.session.get(Staff, staff_id)
+        if staff is None:
+            return {"error": "Staff not found"}, 404
+        service = db.session.get(Service, service_id)
+        if service is None:
+            return {"error": "Service not found"}, 404
+        if staff.branch_id != service.branch_id:
+            return {"error": "Staff and service belong to different branches"}, 400
+        if db.session.get(StaffService, (staff_id, service_id)) is None:
+            db.session.add(StaffService(staff_id=staff_id, service_id=service_id))
+            db.session.commit()
+        return {"staff_id": staff_id, "service_id": service_id}, 200
+
+    @role_required("admin")
+    def delete(self, staff_id, service_id):
+        link = db.session.get(StaffService, (staff_id, service_id))
+        if link is None:
+            return {"error": "Staff does not offer this service"}, 404
+        db.session.delete(link)
+        db.session.commit()
+        return {"message": "Service removed from staff member"}, 200
+
+
+def init_app(app):
+    global _ttl
+    _ttl = app.config["STAFFING_CACHE_TTL"]
+    invalidate_staffing()
@@ -0,0 +1,132 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, insert, select, update
+
+from extensions import db
+from models import BOOKING_ACTIVE_STATUSES, Booking, BookingArchive, Service, Staff, User
+from scheduler import scheduler
+
+# Active status -> status a booking gets once its slot has fully passed
+PAST_DUE_TRANSITIONS = {
+    "pending": "expired",     # Never confirmed
+    "confirmed": "no_show",   # Confirmed but never completed
+}
+
+ARCHIVE_COLUMNS = ["id", "service_id", "user_id", "staff_id", "booking_time", "status", "branch_id"]
+
+
+def _services_by_duration():
+    """Group service ids by `time_taken`, so each duration needs one cutoff instead of per-row date math."""
+    groups = defaultdict(list)
+    for service_id, time_taken in db.session.execute(select(Service.id, Service.time_taken)):
+        groups[time_taken].append(service_id)
+    return groups
+
+
+@event.listens_for(db.session, "before_flush")
+def _delete_archived(session, flush_context, instances):
+    """Archived bookings go with their service, staff member or user, as hot ones do through the relationship cascades."""
+    columns = {Service: "service_id", Staff: "staff_id", User: "user_id"}
+    deleted = [(columns[type(obj)], obj.id) for obj in session.deleted if type(obj) in columns]
+    if not deleted:
+        return
+
+    # A Core statement on the flush's connection, so it runs before the parent rows' DELETE
+    archive = BookingArchive.__table__
+    connection = session.connection()
+    for column, id in deleted:
+        connection.execute(delete(archive).where(archive.c[column] == id))
+
+
+def sweep_bookings(now=None, batch_size=None):
+    """Close active bookings whose `booking_time + Service.time_taken` is in the past."""
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config["BOOKING_SWEEP_BATCH_SIZE"]
+    counts = {new_status: 0 for new_status in PAST_DUE_TRANSITIONS.values()}
+
+    for time_taken, service_ids in _services_by_duration().items():
+        cutoff = now - timedelta(hours=time_taken)
+        for old_status, new_status in PAST_DUE_TRANSITIONS.items():
+            while True:
+                batch = (
+                    select(Booking.id)
+                    .where(
+                        Booking.status == old_status,
+                        Booking.service_id.in_(service_ids),
+                        Booking.booking_time < cutoff,
+                    )
+                    .limit(batch_size)
+                )
+                result = db.session.execute(
+                    update(Booking)
+                    .where(Booking.id.in_(batch))
+                    .values(status=new_status)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                counts[new_status] += result.rowcount
+                if result.rowcount < batch_size:
+                    break
+
+    return counts
+
+
+def archive_bookings(now=None, older_than_days=None, batch_size=None):
+    """Move closed bookings older than the archive horizon into `bookings_archive`."""
+    now = now or datetime.utcnow()
+    if older_than_days is None:
+        older_than_days = current_app.config["BOOKING_ARCHIVE_AFTER_DAYS"]
+    batch_size = batch_size or current_app.config["BOOKING_SWEEP_BATCH_SIZE"]
+    cutoff = now - timedelta(days=older_than_days)
+    archived = 0
+
+    while True:
+        ids = db.session.scalars(
+            select(Booking.id)
+            .where(Booking.status.notin_(BOOKING_ACTIVE_STATUSES), Booking.booking_time < cutoff)
+            .order_by(Booking.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+
+        db.session.execute(
+            insert(BookingArchive).from_select(
+                ARCHIVE_COLUMNS,
+                select(*(getattr(Booking, column) for column in ARCHIVE_COLUMNS)).where(Booking.id.in_(ids)),
+            )
+        )
+        db.session.execute(
+            delete(Booking).where(Booking.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        archived += len(ids)
+
+    return archived
+
+
+def run_booking_sweep():
+    counts = sweep_bookings()
+    counts["archived"] = archive_bookings()
+    current_app.logger.info("Booking sweep: %s", counts)
+    return counts
+
+
+@click.command("sweep-bookings")
+@click.option("--no-archive", is_flag=True, help="Only close past-due bookings, don't move old rows.")
+@with_appcontext
+def sweep_bookings_command(no_archive):
+    """Mark past-due bookings expired/no-show and archive old closed ones."""
+    counts = sweep_bookings()
+    if not no_archive:
+        counts["archived"] = archive_bookings()
+    click.echo(", ".join(f"{name}: {count}" for name, count in counts.items()))
+
+
+def init_app(app):
+    app.cli.add_command(sweep_bookings_command)
+    scheduler.add_job("booking_sweep", run_booking_sweep, app.config["BOOKING_SWEEP_INTERVAL"])
@@ -0,0 +1,85 @@
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import delete, update
+
+from extensions import db
+from models import RefreshTokenFamily
+from scheduler import scheduler
+from session_cache import CLAIM_FIELDS
+
+
+def issue_tokens(identity, claims, family_id=None):
+    """
+    Create an access/refresh token pair. Without `family_id` this starts a new
+    refresh family (a fresh login); otherwise the caller has already rotated it.
+    """
+    jti = str(uuid.uuid4())
+    if family_id is None:
+        family_id = uuid.uuid4().hex
+        db.session.add(RefreshTokenFamily(
+            id=family_id,
+            user_id=int(identity),
+            current_jti=jti,
+            expires_at=datetime.utcnow() + current_app.config["JWT_REFRESH_TOKEN_EXPIRES"],
+        ))
+        db.session.commit()
+
+    access_token = create_access_token(identity=identity, additional_claims=claims)
+    refresh_token = create_refresh_token(identity=identity, additional_claims={**claims, "fam": family_id, "jti": jti})
+    return access_token, refresh_token
+
+
+def rotate_refresh_token(jwt_payload):
+    """
+    Swap the presented refresh token for a new pair. Presenting a token that was
+    already rotated means it leaked, so the whole family is revoked.
+    Returns `None` when the refresh is refused.
+    """
+    family_id = jwt_payload.get("fam")
+    if family_id is None:
+        return None
+
+    new_jti = str(uuid.uuid4())
+    result = db.session.execute(
+        update(RefreshTokenFamily)
+        .where(
+            RefreshTokenFamily.id == family_id,
+            RefreshTokenFamily.current_jti == jwt_payload["jti"],
+            RefreshTokenFamily.revoked.is_(False),
+            RefreshTokenFamily.expires_at > datetime.utcnow(),
+        )
+        .values(current_jti=new_jti)
+    )
+    if result.rowcount != 1:
+        revoke_refresh_family(family_id)
+        return None
+    db.session.commit()
+
+    claims = {field: jwt_payload[field] for field in CLAIM_FIELDS if field in jwt_payload}
+    access_token = create_access_token(identity=jwt_payload["sub"], additional_claims=claims)
+    refresh_token = create_refresh_token(
+        identity=jwt_payload["sub"], additional_claims={**claims, "fam": family_id, "jti": new_jti}
+    )
+    return access_token, refresh_token
+
+
+def revoke_refresh_family(family_id):
+    db.session.execute(
+        update(RefreshTokenFamily).where(RefreshTokenFamily.id == family_id).values(revoked=True)
+    )
+    db.session.commit()
+
+
+def prune_refresh_families(now=None):
+    result = db.session.execute(
+        delete(RefreshTokenFamily).where(RefreshTokenFamily.expires_at < (now or datetime.utcnow()))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    scheduler.add_job("refresh_family_prune", prune_refresh_families, app.config["REFRESH_FAMILY_PRUNE_INTERVAL"])
@@ -1,6 +1,10 @@
 from flask_jwt_extended import get_jwt, jwt_required
 from functools import wraps
-from flask import jsonify
+from sqlalchemy import case, insert, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Dialects with INSERT ... ON CONFLICT; anything else falls back to UPDATE then INSERT
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
 
 def role_required(required_role):
     def decorator(fn):
@@ -9,7 +13,30 @@ def role_required(required_role):
         def wrapper(*args, **kwargs):
             claims = get_jwt()
             if claims.get('role') != required_role:
-                return jsonify({"message": "Access forbidden: Insufficient role"}), 403
+                return {"message": "Access forbidden: Insufficient role"}, 403
             return fn(*args, **kwargs)
         return wrapper
     return decorator
+
+
+def upsert_increment(connection, table, keys, increments, latest=None):
+    """Add `increments` to the row at `keys`, creating it first if needed. `latest` columns only move forward."""
+    latest = {column: value for column, value in (latest or {}).items() if value is not None}
+    changes = {column: table.c[column] + amount for column, amount in increments.items()}
+    changes.update({
+        column: case((or_(table.c[column].is_(None), table.c[column] < value), value), else_=table.c[column])
+        for column, value in latest.items()
+    })
+
+    upsert = UPSERT_INSERTS.get(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(
+            upsert(table).values(**keys, **increments, **latest)
+            .on_conflict_do_update(index_elements=list(keys), set_=changes)
+        )
+        return
+    result = connection.execute(
+        update(table).where(*(table.c[column] == value for column, value in keys.items())).values(changes)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(**keys, **increments, **latest))
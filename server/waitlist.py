@@ -0,0 +1,204 @@
+"""
+Waitlist for booked-out slots.
+
+Instead of retrying POST /bookings, a customer registers for a service with a
+staff member, or with anyone qualified, inside a time window of at most
+WAITLIST_MAX_WINDOW_DAYS. When a booking is canceled, the freed slot goes to
+the first waiting customer it fits, in the transaction of the cancellation:
+a pending booking is made for them and their entry is marked booked.
+
+A staff member's queue is the waiting rows with their staff_id, plus the
+any-staff rows for services they offer in their branch, both served by the
+(staff_id or service_id, status, window_start) indexes. For a slot at T the
+lookup seeks to the windows that opened in [T - max window, T] and takes the
+lowest id (the first to register) whose window also holds the end of its
+service. Entries are claimed with a conditional UPDATE, so concurrent
+cancellations in different workers never give one entry two slots.
+"""
+from datetime import datetime, timedelta
+
+from flask import request
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from flask_restful import Resource
+from sqlalchemy import and_, or_, select, update
+
+from extensions import db
+from idempotency import idempotent
+from models import Booking, Service, Staff, WaitlistEntry
+from scheduler import scheduler
+from staffing import is_qualified, services_for_staff
+
+_max_window_days = 14  # Set from config in init_app()
+_max_entries = 5
+_scan_limit = 50
+
+
+def entry_payload(entry):
+    return {
+        "id": entry.id,
+        "user_id": entry.user_id,
+        "service_id": entry.service_id,
+        "staff_id": entry.staff_id,
+        "window_start": entry.window_start.isoformat(),
+        "window_end": entry.window_end.isoformat(),
+        "status": entry.status,
+        "booking_id": entry.booking_id,
+    }
+
+
+def fill_slot(staff, start, end):
+    """
+    Book the freed slot [start, end) with `staff` for the first waiting
+    customer it fits. Returns the new booking or None; the caller commits.
+    """
+    services = services_for_staff(staff.id)
+    if not services:
+        return None
+    candidates = db.session.scalars(
+        select(WaitlistEntry)
+        .where(
+            WaitlistEntry.status == "waiting",
+            WaitlistEntry.service_id.in_(services),
+            WaitlistEntry.window_start.between(start - timedelta(days=_max_window_days), start),
+            WaitlistEntry.window_end > start,
+            or_(
+                WaitlistEntry.staff_id == staff.id,
+                and_(WaitlistEntry.staff_id.is_(None), WaitlistEntry.branch_id == staff.branch_id),
+            ),
+        )
+        .order_by(WaitlistEntry.id)
+        .limit(_scan_limit)
+    ).all()
+    if not candidates:
+        return None
+
+    durations = dict(db.session.execute(
+        select(Service.id, Service.time_taken).where(Service.id.in_({entry.service_id for entry in candidates}))
+    ).all())
+    for entry in candidates:
+        finish = start + timedelta(hours=durations[entry.service_id])
+        if finish > entry.window_end:
+            continue
+        # A longer service also needs the time after the freed slot
+        if finish > end and Booking.find_conflict([(staff.id, start, finish)]) is not None:
+            continue
+
+        claimed = db.session.execute(
+            update(WaitlistEntry)
+            .where(WaitlistEntry.id == entry.id, WaitlistEntry.status == "waiting")
+            .values(status="booked")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            continue  # Another cancellation got to it first
+
+        booking = Booking(service_id=entry.service_id, staff_id=staff.id, user_id=entry.user_id, booking_time=start)
+        db.session.add(booking)
+        db.session.flush()
+        entry.status, entry.booking_id = "booked", booking.id
+        return booking
+    return None
+
+
+def expire_waitlist(now=None):
+    """Close waiting entries whose window has passed."""
+    result = db.session.execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.status == "waiting", WaitlistEntry.window_end < (now or datetime.utcnow()))
+        .values(status="expired")
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class WaitlistResource(Resource):
+    @jwt_required()
+    @idempotent
+    def post(self):
+        """
+        Wait for a slot: {service_id, staff_id (optional, default anyone qualified), window_start, window_end}.
+        """
+        data = request.get_json() or {}
+        user_id = get_jwt_identity()
+        service_id = data.get("service_id")
+        staff_id = data.get("staff_id")
+
+        if not all([service_id, data.get("window_start"), data.get("window_end")]):
+            return {"error": "Missing required fields"}, 400
+        try:
+            window_start = datetime.fromisoformat(data["window_start"])
+            window_end = datetime.fromisoformat(data["window_end"])
+        except (TypeError, ValueError):
+            return {"error": "Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+
+        service = db.session.get(Service, service_id)
+        if not service:
+            return {"error": "Service not found"}, 404
+        if staff_id is not None:
+            if not db.session.get(Staff, staff_id):
+                return {"error": "Staff not found"}, 404
+            if not is_qualified(staff_id, service_id):
+                return {"error": "Staff does not offer this service"}, 400
+
+        if window_end - window_start < timedelta(hours=service.time_taken):
+            return {"error": "The window is shorter than the service"}, 400
+        if window_end - window_start > timedelta(days=_max_window_days):
+            return {"error": f"The window can be at most {_max_window_days} days long"}, 400
+        if window_end <= datetime.utcnow():
+            return {"error": "The window has already passed"}, 400
+
+        waiting = db.session.scalar(
+            select(db.func.count()).select_from(WaitlistEntry)
+            .where(WaitlistEntry.user_id == user_id, WaitlistEntry.status == "waiting")
+        )
+        if waiting >= _max_entries:
+            return {"error": f"At most {_max_entries} waitlist entries at a time"}, 400
+
+        entry = WaitlistEntry(
+            user_id=user_id, service_id=service_id, staff_id=staff_id,
+            window_start=window_start, window_end=window_end,
+        )
+        db.session.add(entry)
+        db.session.commit()
+        return entry_payload(entry), 201
+
+    @jwt_required()
+    def get(self):
+        """Your waitlist entries, newest first; admins see everyone's (?status= to filter)."""
+        query = select(WaitlistEntry).order_by(WaitlistEntry.id.desc()).limit(100)
+        if get_jwt().get("role") != "admin":
+            query = query.where(WaitlistEntry.user_id == get_jwt_identity())
+        if request.args.get("status"):
+            query = query.where(WaitlistEntry.status == request.args["status"])
+        return [entry_payload(entry) for entry in db.session.scalars(query)], 200
+
+
+class WaitlistEntryResource(Resource):
+    @jwt_required()
+    def delete(self, entry_id):
+        """Leave the waitlist."""
+        entry = db.session.get(WaitlistEntry, entry_id)
+        if entry is None or (str(entry.user_id) != get_jwt_identity() and get_jwt().get("role") != "admin"):
+            return {"error": "Waitlist entry not found"}, 404
+
+        # Conditional, so an entry a cancellation is booking right now stays booked
+        withdrawn = db.session.execute(
+            update(WaitlistEntry)
+            .where(WaitlistEntry.id == entry_id, WaitlistEntry.status == "waiting")
+            .values(status="withdrawn")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not withdrawn:
+            db.session.refresh(entry)
+            return {"error": f"Entry is already {entry.status}"}, 400
+        return {"message": "Removed from the waitlist"}, 200
+
+
+def init_app(app):
+    global _max_window_days, _max_entries, _scan_limit
+    _max_window_days = app.config["WAITLIST_MAX_WINDOW_DAYS"]
+    _max_entries = app.config["WAITLIST_MAX_ENTRIES"]
+    _scan_limit = app.config["WAITLIST_SCAN_LIMIT"]
+    scheduler.add_job("waitlist_expire", expire_waitlist, app.config["WAITLIST_EXPIRE_INTERVAL"])
@@ -0,0 +1,7 @@
+from config import create_app
+
+# Entry point for gunicorn (`gunicorn -c gunicorn.conf.py wsgi:app`) and `flask run`
+app = create_app()
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=10000)